@@ -0,0 +1,437 @@
+"""
+Benchmarks the component request lifecycle on a synthetic project.
+
+The project has one Page made of N Components, each the root of a tree of
+child Components DEPTH levels deep (FANOUT children per Component), K
+deferred Components and M extra registered component urls. The Page's
+primary Component adds the first few Page Components as dependents when
+it's POSTed to.
+
+    python benchmarks/lifecycle.py --components 20 --depth 3 --urls 500 \\
+        --deferred 5 --output before.json
+    python benchmarks/lifecycle.py ... --output after.json --compare before.json
+
+See benchmarks/README.md for the scenarios and the reported numbers.
+"""
+import os
+import gc
+import sys
+import json
+import shutil
+import platform
+import tempfile
+import types
+import argparse
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+URLCONF_NAME = 'components_benchmark_urls'
+PAGE_KEY = 'bench_page'
+
+NODE_TEMPLATE = """{% load components %}<li>{{ label }} {{ payload|length }}<ul>
+{% for child in children %}{% load_component "bench_node" tree=child.tree depth=child.depth node_id=child.node_id %}{% endfor %}
+</ul></li>"""
+
+DEFERRED_TEMPLATE = """<p>deferred {{ slot }}</p>"""
+
+PRIMARY_TEMPLATE = """<form method="POST" action="{{ this_form_url }}"><p>{{ message }}</p></form>"""
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--components', '-n', type=int, default=10,
+                        help="Components on the page (N)")
+    parser.add_argument('--depth', '-d', type=int, default=2,
+                        help="Levels of child components below each page Component (D)")
+    parser.add_argument('--fanout', type=int, default=2,
+                        help="Child components per Component")
+    parser.add_argument('--urls', '-m', type=int, default=100,
+                        help="Extra registered component urls (M)")
+    parser.add_argument('--deferred', '-k', type=int, default=5,
+                        help="Deferred components on the page (K)")
+    parser.add_argument('--dependents', type=int, default=3,
+                        help="Page Components re-rendered as dependents on POST")
+    parser.add_argument('--iterations', '-i', type=int, default=200,
+                        help="Timed runs per scenario")
+    parser.add_argument('--warmup', type=int, default=20,
+                        help="Untimed runs per scenario before timing")
+    parser.add_argument('--scenarios', nargs='+', default=None,
+                        help="Only run these scenarios (default: all)")
+    parser.add_argument('--setting', action='append', default=[], metavar='NAME=VALUE',
+                        help="Extra Django setting, VALUE is a Python literal "
+                             "(eg. --setting COMPONENT_RENDER_POOL_SIZE=4)")
+    parser.add_argument('--output', '-o', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Compare against the results in this JSON file")
+    return parser.parse_args(argv)
+
+
+def configure(options, template_dir):
+    from ast import literal_eval
+    from django.conf import settings
+
+    extra_settings = {}
+    for setting in options.setting:
+        name, value = setting.split('=', 1)
+        extra_settings[name] = literal_eval(value)
+
+    settings.configure(
+        DEBUG=False,
+        TEMPLATE_DEBUG=False,
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        SESSION_ENGINE='django.contrib.sessions.backends.cache',
+        ROOT_URLCONF=URLCONF_NAME,
+        TEMPLATE_DIRS=(template_dir,),
+        INSTALLED_APPS=(
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'django.contrib.sessions',
+            'django.contrib.messages',
+            'components',
+        ),
+        USE_I18N=False,
+        **extra_settings)
+    return extra_settings
+
+
+def write_templates(options, template_dir):
+    bench_dir = os.path.join(template_dir, 'bench')
+    os.makedirs(bench_dir)
+
+    page_parts = ['{% load components %}<html><body>', '{{ components.bench_page }}']
+    for index in range(options.components):
+        page_parts.append('<div class="cmp">{{ components.bench_cmp_%d }}</div>' % index)
+    for slot in range(options.deferred):
+        page_parts.append('{%% load_component "bench_deferred" slot=%d %%}' % slot)
+    page_parts.append('</body></html>')
+
+    templates = {
+        'page.html': '\n'.join(page_parts),
+        'node.html': NODE_TEMPLATE,
+        'deferred.html': DEFERRED_TEMPLATE,
+        'primary.html': PRIMARY_TEMPLATE,
+    }
+    for name, source in templates.items():
+        with open(os.path.join(bench_dir, name), 'w') as template_file:
+            template_file.write(source)
+
+
+def build_project(options):
+    """
+    Creates the Components, Page and urlconf of the synthetic project.
+    """
+    from components.views import Component, Page
+    from components.decorators import obj_cache, shared_obj_cache
+    from components.urls import component_url
+    from django.conf.urls import patterns
+
+    fanout = options.fanout
+
+    class BenchNodeComponent(Component):
+        template_name = 'bench/node.html'
+
+        @obj_cache
+        def payload(self):
+            return range(10)
+
+        @shared_obj_cache
+        def site_name(self):
+            return 'benchmark'
+
+        def get_tree_kwargs(self):
+            return int(self.kwargs['tree']), int(self.kwargs['depth']), int(self.kwargs['node_id'])
+
+        def init(self):
+            tree, depth, node_id = self.get_tree_kwargs()
+            self.ctx.label = '%s %d/%d/%d' % (self.site_name, tree, depth, node_id)
+            self.ctx.payload = self.payload
+            self.ctx.children = []
+            if depth < options.depth:
+                for index in range(fanout):
+                    child_kwargs = {'tree': tree, 'depth': depth + 1,
+                                    'node_id': node_id * fanout + index + 1}
+                    self.add_child_component(BenchNodeComponent, kwargs=child_kwargs)
+                    self.ctx.children.append(child_kwargs)
+
+    def make_tree_root(index):
+        class BenchTreeComponent(BenchNodeComponent):
+            def get_tree_kwargs(self):
+                return index, 0, 0
+        BenchTreeComponent.__name__ = 'BenchTree%dComponent' % index
+        return BenchTreeComponent
+
+    tree_classes = [make_tree_root(index) for index in range(options.components)]
+    dependent_classes = tree_classes[:options.dependents]
+
+    class BenchDeferredComponent(Component):
+        template_name = 'bench/deferred.html'
+        deferred = True
+
+        def init(self):
+            self.ctx.slot = self.kwargs['slot']
+
+    class BenchPrimaryComponent(Component):
+        template_name = 'bench/primary.html'
+
+        def init(self):
+            self.ctx.this_form_url = self.this_url()
+            self.ctx.message = 'primary'
+
+        def handler(self, request):
+            for ComponentClass in dependent_classes:
+                self.add_dependent_component(ComponentClass)
+            return True
+
+    class BenchPage(Page):
+        template_name = 'bench/page.html'
+
+        def set_components(self):
+            for ComponentClass in tree_classes:
+                self.add_component(ComponentClass)
+            for slot in range(options.deferred):
+                self.add_component(BenchDeferredComponent, kwargs={'slot': slot})
+
+    filler_urls = []
+    for index in range(options.urls):
+        FillerComponent = type('BenchFiller%dComponent' % index, (Component,),
+                               {'template_name': 'bench/deferred.html'})
+        filler_urls.append(component_url(r'^filler/%d/(?P<item_id>\d+)/$' % index,
+                                         FillerComponent, 'bench_filler_%d' % index))
+
+    tree_urls = [component_url(r'^cmp/%d/$' % index, ComponentClass, 'bench_cmp_%d' % index)
+                 for index, ComponentClass in enumerate(tree_classes)]
+
+    urlconf = types.ModuleType(URLCONF_NAME)
+    urlconf.urlpatterns = patterns(
+        '',
+        *(filler_urls + tree_urls + [
+            component_url(r'^node/(?P<tree>\d+)/(?P<depth>\d+)/(?P<node_id>\d+)/$',
+                          BenchNodeComponent, 'bench_node'),
+            component_url(r'^deferred/(?P<slot>\d+)/$', BenchDeferredComponent,
+                          'bench_deferred'),
+            component_url(r'^$', BenchPrimaryComponent, PAGE_KEY, PageClass=BenchPage),
+        ]))
+    sys.modules[URLCONF_NAME] = urlconf
+
+
+class RequestMaker(object):
+    """
+    Builds requests the way the middleware would have left them and calls
+    the component view for them directly.
+    """
+    def __init__(self):
+        from django.test.client import RequestFactory
+        self.factory = RequestFactory()
+
+    def prepare(self, request):
+        from django.contrib.auth.models import AnonymousUser
+        from django.contrib.sessions.backends.cache import SessionStore
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        return request
+
+    def get(self, path, data=None, ajax=False):
+        extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        return self.prepare(self.factory.get(path, data or {}, **extra))
+
+    def post(self, path, data=None, ajax=False):
+        extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        return self.prepare(self.factory.post(path, data or {}, **extra))
+
+    def call(self, request):
+        from django.core.urlresolvers import resolve
+        match = resolve(request.path_info)
+        return self.check(request, match.func(request, *match.args, **match.kwargs))
+
+    def check(self, request, response):
+        content = ''.join(response)  # consume streamed responses too
+        if response.status_code != 200:
+            raise AssertionError("%s %s returned %s" % (request.method, request.path,
+                                                        response.status_code))
+        return content
+
+
+def get_scenarios():
+    """
+    The benchmarked scenarios, name -> function returning a function that
+    runs it once.
+    """
+    from django.core.urlresolvers import reverse
+    from components.views import ObjectCache, execute_request
+    from components.utils import fuzzy_reverse, clear_fuzzy_reverse_cache
+
+    maker = RequestMaker()
+
+    def full_page_get():
+        path = reverse(PAGE_KEY)
+        return lambda: maker.call(maker.get(path))
+
+    def ajax_partial_get():
+        path = reverse('bench_cmp_0')
+        return lambda: maker.call(maker.get(path, {'page_key': PAGE_KEY}, ajax=True))
+
+    def ajax_deferred_get():
+        path = reverse('bench_deferred', kwargs={'slot': 0})
+        return lambda: maker.call(maker.get(path, {'page_key': PAGE_KEY, 'deferred': 'true'},
+                                            ajax=True))
+
+    def ajax_post():
+        path = reverse(PAGE_KEY)
+        return lambda: maker.call(maker.post(path, {'page_key': PAGE_KEY}, ajax=True))
+
+    def run_execute_request():
+        def run():
+            request = maker.get('/anything/')
+            return maker.check(request, execute_request(request, PAGE_KEY))
+        return run
+
+    def fuzzy_reverse_cached():
+        kwargs = {'tree': 1, 'depth': 2, 'node_id': 3, 'unused': 4}
+        return lambda: fuzzy_reverse('bench_node', kwargs=kwargs)
+
+    def fuzzy_reverse_uncached():
+        kwargs = {'tree': 1, 'depth': 2, 'node_id': 3, 'unused': 4}
+        def run():
+            clear_fuzzy_reverse_cache()
+            return fuzzy_reverse('bench_node', kwargs=kwargs)
+        return run
+
+    def obj_cache():
+        keys = ['key_%d' % index for index in range(100)]
+        def run():
+            cache = ObjectCache()
+            for key in keys:
+                cache(key, lambda: key)
+            for key in keys:
+                cache(key, lambda: key)
+                cache.get_key_for_child_component(key, {'tree': 1, 'node_id': 2})
+        return run
+
+    return [
+        ('full_page_get', full_page_get),
+        ('ajax_partial_get', ajax_partial_get),
+        ('ajax_deferred_get', ajax_deferred_get),
+        ('ajax_post', ajax_post),
+        ('execute_request', run_execute_request),
+        ('fuzzy_reverse_cached', fuzzy_reverse_cached),
+        ('fuzzy_reverse_uncached', fuzzy_reverse_uncached),
+        ('obj_cache', obj_cache),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure_allocations(run, iterations):
+    """
+    Returns the number of objects tracked by the garbage collector that were
+    allocated and are still alive per run. Garbage collection is off while
+    measuring so temporary cyclic garbage is counted too.
+    """
+    iterations = max(1, min(iterations, 20))
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        for _ in range(iterations):
+            run()
+        return (len(gc.get_objects()) - before) / iterations
+    finally:
+        gc.enable()
+        gc.collect()
+
+
+def run_scenario(run, options):
+    for _ in range(options.warmup):
+        run()
+
+    timings = []
+    start = default_timer()
+    for _ in range(options.iterations):
+        run_start = default_timer()
+        run()
+        timings.append(default_timer() - run_start)
+    total = default_timer() - start
+    timings.sort()
+
+    alloc_objects = measure_allocations(run, options.iterations)
+    return {
+        'iterations': options.iterations,
+        'throughput': options.iterations / total if total else None,
+        'mean_ms': 1000 * sum(timings) / len(timings),
+        'p50_ms': 1000 * percentile(timings, 0.5),
+        'p99_ms': 1000 * percentile(timings, 0.99),
+        'max_ms': 1000 * timings[-1],
+        'alloc_objects': alloc_objects,
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('config') != results['config']:
+        print "Warning: the baseline was run with a different config: %r" % baseline.get('config')
+    print
+    print "%-24s %12s %12s %8s" % ('p50 ms', 'baseline', 'now', 'change')
+    for name, result in sorted(results['scenarios'].items()):
+        old = baseline.get('scenarios', {}).get(name)
+        if not old:
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+        print "%-24s %12.3f %12.3f %+7.1f%%" % (name, old['p50_ms'], result['p50_ms'], change)
+
+
+def main(argv=None):
+    options = parse_args(sys.argv[1:] if argv is None else argv)
+    template_dir = tempfile.mkdtemp(prefix='components-benchmark-')
+    try:
+        write_templates(options, template_dir)
+        extra_settings = configure(options, template_dir)
+        build_project(options)
+
+        import django
+        results = {
+            'config': {
+                'components': options.components,
+                'depth': options.depth,
+                'fanout': options.fanout,
+                'urls': options.urls,
+                'deferred': options.deferred,
+                'dependents': options.dependents,
+                'settings': extra_settings,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'django': django.get_version(),
+            },
+            'scenarios': {},
+        }
+
+        print "%-24s %10s %10s %10s %12s" % ('scenario', 'req/s', 'p50 ms', 'p99 ms', 'alloc objs')
+        for name, make_run in get_scenarios():
+            if options.scenarios and name not in options.scenarios:
+                continue
+            result = run_scenario(make_run(), options)
+            results['scenarios'][name] = result
+            print "%-24s %10.1f %10.3f %10.3f %12d" % (name, result['throughput'],
+                                                       result['p50_ms'], result['p99_ms'],
+                                                       result['alloc_objects'])
+    finally:
+        shutil.rmtree(template_dir, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    if options.compare:
+        compare(results, options.compare)
+    return results
+
+
+if __name__ == '__main__':
+    main()
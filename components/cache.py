@@ -0,0 +1,243 @@
+import time
+import threading
+from collections import OrderedDict
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models import signals
+from django.utils import translation
+
+_caches = {}
+
+def get_component_cache():
+    """
+    The Django cache backend used by the framework, configured with the
+    COMPONENT_CACHE_ALIAS setting (the 'default' cache if not set).
+    """
+    alias = getattr(settings, 'COMPONENT_CACHE_ALIAS', 'default')
+    if alias not in _caches:
+        _caches[alias] = get_cache(alias)
+    return _caches[alias]
+
+def resolve_vary_on(request_info, path):
+    """
+    Resolves a dotted `cache_vary_on` entry like 'user.pk' or 'GET.page'
+    against the request info, looking up each part as an item first and an
+    attribute second. Missing values resolve to None.
+    """
+    value = request_info
+    for part in path.split('.'):
+        try:
+            value = value[part]
+        except (TypeError, KeyError, AttributeError):
+            value = getattr(value, part, None)
+        if value is None:
+            break
+    return value
+
+def _get_tag_key(tag):
+    if isinstance(tag, unicode):
+        tag = tag.encode('utf-8')
+    return 'components:tag:%s' % md5(tag).hexdigest()
+
+def _new_generation():
+    # Start from the current time rather than 0 so that a generation that
+    # was evicted (or expired) from the cache can't come back with a value
+    # that old cache keys were built with. Losing a generation therefore
+    # only invalidates its renders early.
+    return int(time.time() * 1000)
+
+def get_tag_timeout(timeout=None):
+    """
+    How long tag generations are kept: the COMPONENT_CACHE_TAG_TIMEOUT
+    setting (30 days by default), or `timeout` if that's longer. Without an
+    explicit timeout they would get the backend's default one, and a
+    generation that expires invalidates every render with its tag.
+    """
+    tag_timeout = getattr(settings, 'COMPONENT_CACHE_TAG_TIMEOUT', 60 * 60 * 24 * 30)
+    return max(tag_timeout, timeout or 0)
+
+def get_tag_generations(tags, timeout=None):
+    """
+    Returns the current generation of each tag, in order, creating the
+    missing ones (kept for at least `timeout`, see get_tag_timeout).
+    """
+    if not tags:
+        return []
+    cache = get_component_cache()
+    timeout = get_tag_timeout(timeout)
+    keys = [_get_tag_key(tag) for tag in tags]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            generation = _new_generation()
+            if not cache.add(key, generation, timeout):
+                generation = cache.get(key, generation)
+            generations[key] = generation
+    return [generations[key] for key in keys]
+
+def invalidate_tags(*tags):
+    """
+    Invalidates every cached render built with any of `tags` by bumping
+    the tags' generations (fragment cache keys include them). This is one
+    cache operation per tag no matter how many renders are cached.
+    """
+    cache = get_component_cache()
+    for tag in tags:
+        key = _get_tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not in the cache (anymore), any new generation will do.
+            cache.set(key, _new_generation(), get_tag_timeout())
+
+def invalidate_tags_on_save(ModelClass, *tags):
+    """
+    Invalidates `tags` whenever an instance of `ModelClass` is saved or
+    deleted. Tags can be strings, which are formatted with the instance's
+    attributes (eg. 'attendee:%(id)s'), or callables taking the instance
+    and returning a list of tags.
+    """
+    def receiver(sender, instance, **kwargs):
+        instance_tags = []
+        for tag in tags:
+            if callable(tag):
+                instance_tags.extend(tag(instance))
+            else:
+                instance_tags.append(tag % instance.__dict__)
+        invalidate_tags(*instance_tags)
+
+    dispatch_uid = 'components.cache:%s.%s:%r' % (ModelClass.__module__,
+                                                  ModelClass.__name__, tags)
+    signals.post_save.connect(receiver, sender=ModelClass, weak=False,
+                              dispatch_uid=dispatch_uid)
+    signals.post_delete.connect(receiver, sender=ModelClass, weak=False,
+                                dispatch_uid=dispatch_uid)
+
+def get_fragment_cache_key(component, defer_info=()):
+    """
+    The cache key for the rendered output of `component`, built from its
+    component_key, param_key, kwargs and `cache_vary_on` values, the
+    page_key it's rendered for (which ends up in its forms and urls),
+    `defer_info` (what the deferred placeholders in the render depend on)
+    and the generations of its cache tags.
+    """
+    vary_on = [(path, resolve_vary_on(component.request_info, path))
+               for path in component.cache_vary_on]
+    raw_key = repr((component.component_key,
+                    component.param_key,
+                    component.request_info.page_key,
+                    sorted((component.kwargs or {}).items()),
+                    vary_on,
+                    tuple(defer_info),
+                    get_tag_generations(component.get_cache_tags(component.kwargs),
+                                        component.cache_timeout)))
+    return 'components:fragment:%s' % md5(raw_key).hexdigest()
+
+def get_prefetch_cache_key(session_key, nonce, component_key, param_key, kwargs):
+    """
+    The cache key for the prefetched render of a deferred component (see
+    Component.prefetch_on_server) for one session and page load (`nonce`).
+    """
+    # unicode everything, url kwargs are strings but the ones given to
+    # add_component needn't be
+    raw_key = repr((unicode(session_key),
+                    unicode(nonce),
+                    unicode(component_key),
+                    unicode(param_key or ''),
+                    sorted((unicode(key), unicode(value)) for key, value in (kwargs or {}).items()),
+                    translation.get_language()))
+    return 'components:prefetch:%s' % md5(raw_key).hexdigest()
+
+
+REQUEST_SCOPE = 'request'
+PROCESS_SCOPE = 'process'
+SHARED_SCOPE = 'shared'
+
+class ProcessObjectCache(object):
+    """
+    A thread safe LRU cache with per entry timeouts, shared by all requests
+    handled by this process. Used for `PROCESS_SCOPE` ObjectCache values.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns a (found, value) tuple
+        """
+        with self.lock:
+            entry = self.data.pop(key, None)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.time():
+                return False, None
+            # re-insert to mark it as most recently used
+            self.data[key] = entry
+            return True, value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time.time() + timeout, value)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+class SharedObjectCache(object):
+    """
+    Stores `SHARED_SCOPE` ObjectCache values in a Django cache (the
+    COMPONENT_OBJ_CACHE_ALIAS setting, or the component cache), so they are
+    shared between processes and servers.
+    """
+    def __init__(self, alias=None):
+        self.cache = get_cache(alias) if alias else get_component_cache()
+
+    def _get_key(self, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return 'components:obj:%s' % md5(repr(key)).hexdigest()
+
+    def get(self, key):
+        # Values are wrapped in a tuple so that None can be cached
+        wrapped = self.cache.get(self._get_key(key))
+        if wrapped is None:
+            return False, None
+        return True, wrapped[0]
+
+    def set(self, key, value, timeout):
+        self.cache.set(self._get_key(key), (value,), timeout)
+
+    def delete(self, key):
+        self.cache.delete(self._get_key(key))
+
+_object_tiers = {}
+_object_tiers_lock = threading.Lock()
+
+def get_object_tier(scope):
+    """
+    The cache storing ObjectCache values of `scope` beyond the request
+    """
+    with _object_tiers_lock:
+        if scope not in _object_tiers:
+            if scope == PROCESS_SCOPE:
+                tier = ProcessObjectCache(
+                    getattr(settings, 'COMPONENT_OBJ_CACHE_MAX_ENTRIES', 1000))
+            elif scope == SHARED_SCOPE:
+                tier = SharedObjectCache(getattr(settings, 'COMPONENT_OBJ_CACHE_ALIAS', None))
+            else:
+                raise ValueError("Unknown ObjectCache scope: %r" % (scope,))
+            _object_tiers[scope] = tier
+    return _object_tiers[scope]
+
+def get_object_timeout(timeout=None):
+    if timeout is None:
+        timeout = getattr(settings, 'COMPONENT_OBJ_CACHE_TIMEOUT', 60)
+    return timeout
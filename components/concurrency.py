@@ -0,0 +1,160 @@
+import sys
+import threading
+import Queue
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import connections
+from django.utils import translation, timezone
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+_context_hooks = []
+
+class _IdleClosingQueue(Queue.Queue):
+    """
+    The queue pool threads take their jobs from. A thread that finds it
+    empty is about to go idle, so it closes its database connections before
+    waiting (each thread has its own connections, and we don't want an idle
+    thread holding a transaction open), while a thread that goes straight
+    on to its next job keeps reusing them.
+    """
+    def get(self, block=True, timeout=None):
+        if block:
+            try:
+                return Queue.Queue.get(self, False)
+            except Queue.Empty:
+                for connection in connections.all():
+                    connection.close()
+        return Queue.Queue.get(self, block, timeout)
+
+class _ThreadPool(ThreadPool):
+    def _setup_queues(self):
+        ThreadPool._setup_queues(self)
+        self._inqueue = _IdleClosingQueue()
+        self._quick_put = self._inqueue.put
+
+def register_context_hook(capture, activate, deactivate):
+    """
+    Carries thread local state over to pool threads: `capture()` is called
+    when a job is submitted, and its result is passed to `activate` and
+    `deactivate`, which are called in the pool thread before and after the
+    job runs.
+    """
+    _context_hooks.append((capture, activate, deactivate))
+
+def get_pool(setting_name):
+    """
+    Returns the process wide ThreadPool sized by the `setting_name` setting,
+    or None if concurrency is turned off for it (the setting is missing or
+    smaller than 2).
+
+    Pools are created lazily, once per process, so that pre-forking servers
+    don't end up sharing threads created in the master process.
+    """
+    size = getattr(settings, setting_name, 0) or 0
+    if size < 2:
+        return None
+    with _pools_lock:
+        pool = _pools.get(setting_name)
+        if pool is None:
+            pool = _pools[setting_name] = _ThreadPool(size)
+    return pool
+
+def in_worker_thread(pool=None):
+    """
+    True if the current thread is running a job submitted through `run_all`
+    (to `pool`, if given).
+    """
+    worker_pool = getattr(_local, 'pool', None)
+    if pool is None:
+        return worker_pool is not None
+    return worker_pool is pool
+
+class _Job(object):
+    """
+    Runs `func` in a pool thread with the calling thread's active language
+    and timezone. The thread's database connections are closed once it
+    goes idle (see `_IdleClosingQueue`), so a burst of jobs reuses them.
+    """
+    def __init__(self, func, pool):
+        self.func = func
+        self.pool = pool
+        self.language = translation.get_language()
+        self.timezone = timezone.get_current_timezone()
+        self.context = [(hook, hook[0]()) for hook in _context_hooks]
+
+    def __call__(self):
+        _local.pool = self.pool
+        translation.activate(self.language)
+        timezone.activate(self.timezone)
+        for (capture, activate, deactivate), state in self.context:
+            activate(state)
+        try:
+            return True, self.func()
+        except BaseException:
+            return False, sys.exc_info()
+        finally:
+            for (capture, activate, deactivate), state in self.context:
+                deactivate(state)
+            timezone.deactivate()
+            translation.deactivate()
+            _local.pool = None
+
+def run_all(pool, funcs):
+    """
+    Calls every function in `funcs` and returns their results in the same
+    order.
+
+    If `pool` is None (or we are already inside one of its threads, where
+    waiting on the pool again could deadlock) the functions are run one
+    after another in this thread. Otherwise they run concurrently and, once all of
+    them have finished, the exception of the first function (in `funcs`
+    order) that failed is re-raised, which is the same exception a serial run
+    would have raised.
+    """
+    funcs = list(funcs)
+    if pool is None or len(funcs) < 2 or in_worker_thread(pool):
+        return [func() for func in funcs]
+
+    pending = [pool.apply_async(_Job(func, pool)) for func in funcs]
+    outcomes = [async_result.get() for async_result in pending]
+    results = []
+    for succeeded, value in outcomes:
+        if not succeeded:
+            raise value[0], value[1], value[2]
+        results.append(value)
+    return results
+
+def run_in_background(pool, func):
+    """
+    Calls `func` in a thread of `pool` (see `_Job`) without waiting for it.
+    Exceptions are swallowed, so `func` should handle its own.
+    """
+    return pool.apply_async(_Job(func, pool))
+
+def run_unordered(pool, funcs):
+    """
+    Calls every function in `funcs`, yielding an (index, succeeded, value)
+    tuple for each as soon as it finishes, where `value` is the function's
+    result, or the `sys.exc_info()` of the exception it raised.
+
+    Without a pool (see `run_all`) the functions run one after another, in
+    order, as the results are consumed.
+    """
+    funcs = list(funcs)
+    if pool is None or len(funcs) < 2 or in_worker_thread(pool):
+        for index, func in enumerate(funcs):
+            try:
+                yield index, True, func()
+            except BaseException:
+                yield index, False, sys.exc_info()
+        return
+
+    finished = Queue.Queue()
+    for index, func in enumerate(funcs):
+        pool.apply_async(_Job(func, pool),
+                         callback=lambda outcome, index=index: finished.put((index,) + outcome))
+    for _ in funcs:
+        yield finished.get()
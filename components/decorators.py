@@ -1,7 +1,9 @@
-
 from functools import wraps, partial
 
-def obj_cache(key_name_or_var_func, force_shared=False, args=None, kwargs=None):
+from .cache import REQUEST_SCOPE
+
+def obj_cache(key_name_or_var_func, force_shared=False, args=None, kwargs=None,
+              scope=REQUEST_SCOPE, timeout=None, recomputable=False):
     """
     If key_name_or_var_func is a callable then obj_cache is being used
     as a decorator. If it's a string, then it's being called directly
@@ -12,17 +14,28 @@ def obj_cache(key_name_or_var_func, force_shared=False, args=None, kwargs=None):
     and kwargs parameters. This ensures that the objects are only
     shared between components with the same set of arguments, which is
     normally what we want.
+
+    `scope` and `timeout` decide if (and for how many seconds) the value is
+    also cached beyond the current request, see ObjectCache. Only use a
+    scope other than REQUEST_SCOPE for values that don't depend on anything
+    but the key (eg. not on the current user).
+
+    With `recomputable` set, the value may be dropped from the ObjectCache
+    to keep the request within COMPONENT_OBJ_CACHE_MAX_BYTES, and computed
+    again the next time it's needed. Only set it for values that aren't
+    modified after they are computed.
     """
     def decorator(name, var_func):
         wraps(var_func)
         def func(self):
             has_param_key = hasattr(self, "param_key") and self.param_key
             if has_param_key and not force_shared:
-                param_name = self.obj_cache.get_key_for_child_component(name, self.kwargs)
+                param_name = self.get_child_obj_cache_key(name)
             else:
                 param_name = name
 
-            return self.obj_cache(param_name, lambda: var_func(self))
+            return self.obj_cache(param_name, lambda: var_func(self),
+                                  scope=scope, timeout=timeout, recomputable=recomputable)
         return property(func)
 
     if hasattr(key_name_or_var_func, "__call__"):
@@ -30,7 +43,8 @@ def obj_cache(key_name_or_var_func, force_shared=False, args=None, kwargs=None):
     else:
         return partial(decorator, key_name_or_var_func)
 
-def shared_obj_cache(key_name_or_var_func, args=None, kwargs=None):
+def shared_obj_cache(key_name_or_var_func, args=None, kwargs=None,
+                     scope=REQUEST_SCOPE, timeout=None, recomputable=False):
     """
     Same as obj_cache but doesn't use param key (same as calling obj_cache
     with force_shared)
@@ -38,10 +52,95 @@ def shared_obj_cache(key_name_or_var_func, args=None, kwargs=None):
     def decorator(name, var_func):
         wraps(var_func)
         def func(self):
-            return self.obj_cache(name, lambda: var_func(self))
+            return self.obj_cache(name, lambda: var_func(self),
+                                  scope=scope, timeout=timeout, recomputable=recomputable)
         return property(func)
 
     if hasattr(key_name_or_var_func, "__call__"):
         return decorator(key_name_or_var_func.__name__, key_name_or_var_func)
     else:
         return partial(decorator, key_name_or_var_func)
+
+class BatchObjCache(object):
+    """
+    The property created by `batch_obj_cache`.
+    """
+    def __init__(self, name, load_many, get_key):
+        self.name = name
+        self.load_many = load_many
+        self.get_key = get_key
+
+    def get_cache_key(self, key):
+        return u"%s[batch:%s]" % (self.name, key)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        key = self.get_key(instance)
+        return instance.obj_cache(self.get_cache_key(key),
+                                  lambda: self.load_many([key]).get(key))
+
+    def prime(self, components, obj_cache):
+        """
+        Loads the values for all `components` that aren't cached yet with a
+        single call to `load_many`.
+        """
+        keys = []
+        for component in components:
+            key = self.get_key(component)
+            if self.get_cache_key(key) not in obj_cache.data and key not in keys:
+                keys.append(key)
+        if keys:
+            values = self.load_many(keys)
+            for key in keys:
+                obj_cache.set(self.get_cache_key(key), values.get(key))
+
+def batch_obj_cache(key, name=None):
+    """
+    Like obj_cache, but for values that can be loaded for many components
+    with one call (think `in_bulk`). Decorate a function that takes a list
+    of keys and returns a dict mapping them to values, and pass `key`, a
+    function returning the key for a component:
+
+        class AttendeeComponent(Component):
+            @batch_obj_cache(key=lambda self: int(self.kwargs['attendee_id']))
+            def attendee(keys):
+                return AttendanceRecord.objects.in_bulk(keys)
+
+    When components are added with `add_child_component`, the keys of all
+    the sibling child components are loaded together, before any of their
+    `final`s run. Anywhere else (or in `init`) it loads a single key.
+    Keys missing from the returned dict are cached as None.
+    """
+    def decorator(load_many):
+        return BatchObjCache(name or load_many.__name__, load_many, key)
+    return decorator
+
+_batch_obj_caches = {}
+
+def get_batch_obj_caches(ComponentClass):
+    # Read the class dicts rather than getattr, which would run the
+    # function of every cached_property on the class.
+    if ComponentClass not in _batch_obj_caches:
+        batches = []
+        seen = set()
+        for cls in ComponentClass.__mro__:
+            for attr, value in cls.__dict__.iteritems():
+                if attr not in seen:
+                    seen.add(attr)
+                    if isinstance(value, BatchObjCache):
+                        batches.append(value)
+        _batch_obj_caches[ComponentClass] = batches
+    return _batch_obj_caches[ComponentClass]
+
+def prime_batch_obj_caches(components, obj_cache):
+    """
+    Loads every `batch_obj_cache` value used by `components` with one call
+    per property.
+    """
+    components_by_batch = {}
+    for component in components:
+        for batch in get_batch_obj_caches(component.__class__):
+            components_by_batch.setdefault(batch, []).append(component)
+    for batch, batch_components in components_by_batch.iteritems():
+        batch.prime(batch_components, obj_cache)
@@ -0,0 +1,39 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...warmup import get_component_template_names, load_templates
+
+class Command(BaseCommand):
+    help = ("Checks that the templates of all registered Components and Pages exist "
+            "and compile, and reports the ones that don't. This runs in its own process, "
+            "so it doesn't warm up any server; see components.warmup.warm_templates.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--list',
+                    action='store_true',
+                    dest='list',
+                    default=False,
+                    help='Only list the templates that would be loaded'),
+    )
+
+    def handle(self, *args, **options):
+        template_names = get_component_template_names()
+        if options['list']:
+            for template_name in template_names:
+                self.stdout.write("%s\n" % template_name)
+            return
+
+        loaded, errors = load_templates(template_names)
+        verbosity = int(options.get('verbosity', 1))
+        if verbosity > 1:
+            for template_name in loaded:
+                self.stdout.write("Loaded %s\n" % template_name)
+        if verbosity > 0:
+            self.stdout.write("Loaded %d of %d component templates\n"
+                              % (len(loaded), len(template_names)))
+
+        if errors:
+            raise CommandError("Couldn't load %d component template(s):\n%s" % (
+                len(errors),
+                "\n".join("  %s: %s" % item for item in sorted(errors.items()))))
@@ -0,0 +1 @@
+# Django < 1.7 only runs the tests of (and finds) apps with a models module
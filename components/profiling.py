@@ -0,0 +1,210 @@
+import os
+import time
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils.importlib import import_module
+
+from .concurrency import register_context_hook
+
+logger = logging.getLogger(__name__)
+
+# Nodes whose phases are currently running in this thread, innermost last
+_current = threading.local()
+
+def _get_stack():
+    if not hasattr(_current, 'stack'):
+        _current.stack = []
+    return _current.stack
+
+def _set_stack(stack):
+    _current.stack = stack
+
+# Components initialized on a pool are profiled under the node that
+# submitted them
+register_context_hook(lambda: list(_get_stack()), _set_stack, lambda stack: _set_stack([]))
+
+def profiling_enabled():
+    return getattr(settings, 'COMPONENT_PROFILING', False)
+
+class _NullPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+def _cpu_time():
+    user, system = os.times()[:2]
+    return user + system
+
+def _query_count():
+    # Queries are only recorded with DEBUG on
+    if settings.DEBUG:
+        return len(connection.queries)
+    return None
+
+class ProfileNode(object):
+    """
+    The timings of one Component (or Page). `phases` maps phase names to
+    dicts with the phase's total wall time, its wall time excluding nested
+    phases (`self`), CPU time (of the whole process) and query count, all
+    summed over every time the phase ran.
+    """
+    def __init__(self, label):
+        self.label = label
+        self.phases = {}
+        self.children = []
+
+    def add(self, phase, wall, wall_self, cpu, queries):
+        totals = self.phases.setdefault(phase, {'wall': 0.0, 'self': 0.0, 'cpu': 0.0,
+                                                'queries': 0, 'count': 0})
+        totals['wall'] += wall
+        totals['self'] += wall_self
+        totals['cpu'] += cpu
+        if queries is not None:
+            totals['queries'] += queries
+        totals['count'] += 1
+
+    def self_time(self):
+        return sum(totals['self'] for totals in self.phases.itervalues())
+
+    def as_dict(self):
+        return {
+            'label': self.label,
+            'phases': self.phases,
+            'children': [child.as_dict() for child in self.children],
+        }
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+class _Phase(object):
+    def __init__(self, profiler, node, name):
+        self.profiler = profiler
+        self.node = node
+        self.name = name
+
+    def __enter__(self):
+        stack = _get_stack()
+        stack.append(self)
+        self.thread = threading.current_thread()
+        self.nested_wall = 0.0
+        self.queries = _query_count()
+        self.cpu = _cpu_time()
+        self.wall = time.time()
+
+    def __exit__(self, *exc_info):
+        wall = time.time() - self.wall
+        cpu = _cpu_time() - self.cpu
+        queries = _query_count()
+        if queries is not None and self.queries is not None:
+            queries -= self.queries
+
+        stack = _get_stack()
+        stack.pop()
+        # Phases running concurrently on a pool overlap, so they only count
+        # as nested time of the phase they ran in if it's in the same thread
+        if stack and stack[-1].thread is self.thread:
+            stack[-1].nested_wall += wall
+        with self.profiler.lock:
+            self.node.add(self.name, wall, wall - self.nested_wall, cpu, queries)
+        return False
+
+class ComponentProfiler(object):
+    """
+    Records the time spent in each lifecycle phase (guard, init, handler,
+    final, init_child_components, render...) of every Component and Page in
+    a request, as a tree: components built while another component's phase
+    runs (child, dependent and secondary components) are its children.
+
+    Enabled with the COMPONENT_PROFILING setting. The results are sent as a
+    `Server-Timing` header, shown next to the component debug info when
+    DEBUG is on, logged to the `components.profiling` logger and passed to
+    the function named by the COMPONENT_PROFILER_CALLBACK setting (called
+    with the request and `as_dict()`).
+
+    The request's ObjectCacheStats (`obj_cache_stats`), if set, are added
+    to the `Server-Timing` header and logged too.
+    """
+    def __init__(self):
+        self.roots = []
+        self.lock = threading.Lock()
+        self.obj_cache_stats = None
+
+    def phase(self, obj, name, label):
+        node = getattr(obj, '_profile_node', None)
+        if node is None:
+            node = obj._profile_node = ProfileNode(label)
+            stack = _get_stack()
+            with self.lock:
+                if stack:
+                    stack[-1].node.children.append(node)
+                else:
+                    self.roots.append(node)
+        return _Phase(self, node, name)
+
+    def nodes(self):
+        for root in self.roots:
+            for node in root.walk():
+                yield node
+
+    def as_dict(self):
+        return [root.as_dict() for root in self.roots]
+
+    def get_server_timing(self, max_components=10, max_keys=3):
+        """
+        The `Server-Timing` header value: the time spent in each phase over
+        all components, plus the slowest components (and ObjectCache keys).
+        """
+        phase_totals = {}
+        for node in self.nodes():
+            for phase, totals in node.phases.iteritems():
+                phase_totals[phase] = phase_totals.get(phase, 0.0) + totals['self']
+
+        metrics = ['%s;dur=%.2f' % (phase, seconds * 1000)
+                   for phase, seconds in sorted(phase_totals.items())]
+        slowest = sorted(self.nodes(), key=lambda node: -node.self_time())[:max_components]
+        for index, node in enumerate(slowest):
+            metrics.append('cmp%d;dur=%.2f;desc="%s"' % (
+                index, node.self_time() * 1000, node.label.replace('"', '')))
+
+        if self.obj_cache_stats is not None:
+            totals = self.obj_cache_stats.totals()
+            metrics.append('obj_cache;dur=%.2f;desc="%d hits, %d misses, %d waits"' % (
+                totals['time'] * 1000, totals['hits'], totals['misses'], totals['waits']))
+            for index, (key, stats) in enumerate(self.obj_cache_stats.slowest(max_keys)):
+                metrics.append('key%d;dur=%.2f;desc="%s"' % (
+                    index, stats['time'] * 1000,
+                    unicode(key).encode('ascii', 'replace').replace('"', '')))
+        return ', '.join(metrics)
+
+    def finish(self, request, response):
+        """
+        Report the profile for `request`
+        """
+        if not response.has_header('Server-Timing'):
+            response['Server-Timing'] = self.get_server_timing()
+
+        profile = self.as_dict()
+        logger.debug("Component profile for %s: %r", request.path, profile)
+        if self.obj_cache_stats is not None:
+            logger.debug("ObjectCache stats for %s: %r", request.path,
+                         self.obj_cache_stats.as_dict())
+            biggest = self.obj_cache_stats.biggest(10)
+            if biggest:
+                logger.debug("Biggest ObjectCache keys for %s: %r", request.path, biggest)
+
+        callback = getattr(settings, 'COMPONENT_PROFILER_CALLBACK', None)
+        if callback:
+            if isinstance(callback, basestring):
+                module_name, func_name = callback.rsplit('.', 1)
+                callback = getattr(import_module(module_name), func_name)
+            callback(request, profile)
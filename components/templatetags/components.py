@@ -1,9 +1,9 @@
 
-from hashlib import md5
-
 from django.template import base as tmp
 from django.utils.safestring import mark_safe
 
+from ..utils import get_param_key
+
 register = tmp.Library()
 
 class ComponentNode(tmp.Node):
@@ -13,7 +13,7 @@ class ComponentNode(tmp.Node):
         self.kwargs = kwargs
 
     def render(self, context):
-        from django.core.urlresolvers import reverse, NoReverseMatch
+        from django.core.urlresolvers import NoReverseMatch
 
 
         if 'url_kwargs_dict' in self.kwargs and len(self.kwargs) == 1:
@@ -32,16 +32,13 @@ class ComponentNode(tmp.Node):
             raise KeyError(u"Missing component key for load_component")
 
         try:
-            url = reverse(component_key,
-                          kwargs=kwargs,
-                          current_app=context.current_app)
+            param_key = get_param_key(component_key, kwargs,
+                                      current_app=context.current_app)
         except NoReverseMatch:
             raise KeyError(
                 u"No component found for key {key} and kwargs {kwargs}".format(
                     key=component_key, kwargs=kwargs))
 
-        param_key = md5(url).hexdigest()
-
         components = context.get('components')
         component = components.get(param_key)
         components.accessed_keys.append(param_key)
@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf.urls import patterns
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from .cache import (
+    get_component_cache, get_object_tier, get_tag_generations, invalidate_tags, PROCESS_SCOPE,
+)
+from .urls import component_url
+from .utils import get_param_key
+from .views import (
+    BatchComponentView, Component, ComponentError, ObjectCache, ObjectCacheStats, Page,
+    StrippedRequestInfo,
+)
+
+class FragmentCachedComponent(Component):
+    template_name = 'fragment_cached.html'
+    cache_timeout = 60
+    cache_tags = ('fragment_cached',)
+
+# (event, card_id) of BatchedComponent guards and inits, in order
+batch_events = []
+
+class BatchedComponent(Component):
+    template_name = 'fragment_cached.html'
+
+    def guard(self):
+        batch_events.append(('guard', self.kwargs.get('card_id')))
+
+    def init(self):
+        batch_events.append(('init', self.kwargs.get('card_id')))
+
+class BatchPageComponent(Component):
+    template_name = 'fragment_cached.html'
+
+class BatchPage(Page):
+    template_name = 'fragment_cached.html'
+
+urlpatterns = patterns(
+    '',
+    component_url(r'^fragment_cached/$', FragmentCachedComponent, 'fragment_cached'),
+    component_url(r'^batched/(?P<card_id>\d+)/$', BatchedComponent, 'batched'),
+    component_url(r'^batch_page/$', BatchPageComponent, 'batch_page', PageClass=BatchPage),
+)
+
+class ComponentsTestCase(TestCase):
+    """
+    Renders 'fragment_cached.html' from a temporary template dir, and
+    caches in an empty locmem cache.
+    """
+    urls = 'components.tests'
+
+    def setUp(self):
+        self.template_dir = tempfile.mkdtemp()
+        self.write_template('page_key={{ component_info.page_key }}')
+        self.settings_override = override_settings(
+            TEMPLATE_DIRS=(self.template_dir,),
+            CACHES={'components_tests': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'components_tests',
+            }},
+            COMPONENT_CACHE_ALIAS='components_tests')
+        self.settings_override.enable()
+        get_component_cache().clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.template_dir)
+
+    def write_template(self, content):
+        with open(os.path.join(self.template_dir, 'fragment_cached.html'), 'w') as template:
+            template.write(content)
+
+class FragmentCacheTest(ComponentsTestCase):
+    def render(self, page_key, data=None):
+        request = RequestFactory().get('/fragment_cached/', data or {})
+        request.user = AnonymousUser()
+        request_info = StrippedRequestInfo(request, page_key, {}, passive=True)
+        component = FragmentCachedComponent(request_info, ObjectCache())
+        component.run_final()
+        component.init_child_components(request_info)
+        return component, component.render(request)
+
+    def test_cached_render_depends_on_page_key(self):
+        component, page_a = self.render('page_a')
+        self.assertIsNone(component.cached_render)
+        component, page_b = self.render('page_b')
+        self.assertIsNone(component.cached_render)
+        self.assertEqual(page_a, 'page_key=page_a')
+        self.assertEqual(page_b, 'page_key=page_b')
+
+        component, cached_page_a = self.render('page_a')
+        self.assertIsNotNone(component.cached_render)
+        self.assertEqual(cached_page_a, page_a)
+
+    def test_cached_render_depends_on_query_string(self):
+        self.render('page_a', {'filter': 'a'})
+        component, render = self.render('page_a', {'filter': 'b'})
+        self.assertIsNone(component.cached_render)
+        component, render = self.render('page_a', {'filter': 'a'})
+        self.assertIsNotNone(component.cached_render)
+
+    def test_render_using_csrf_token_is_not_cached(self):
+        self.write_template('<form>{% csrf_token %}</form>')
+        self.render('page_a')
+        component, render = self.render('page_a')
+        self.assertIsNone(component.cached_render)
+        self.assertTrue(component.render_uncacheable)
+
+    def test_invalidating_a_tag_drops_cached_renders(self):
+        self.render('page_a')
+        invalidate_tags('fragment_cached')
+        component, render = self.render('page_a')
+        self.assertIsNone(component.cached_render)
+        component, render = self.render('page_a')
+        self.assertIsNotNone(component.cached_render)
+
+class CacheTagsTest(ComponentsTestCase):
+    def test_invalidate_tags_only_bumps_their_generations(self):
+        generations = get_tag_generations(['a', 'b'])
+        self.assertEqual(get_tag_generations(['a', 'b']), generations)
+        invalidate_tags('a')
+        new_generations = get_tag_generations(['a', 'b'])
+        self.assertNotEqual(new_generations[0], generations[0])
+        self.assertEqual(new_generations[1], generations[1])
+
+    def test_missing_generation_is_recreated_on_invalidation(self):
+        invalidate_tags('never_read')
+        generation = get_tag_generations(['never_read'])
+        invalidate_tags('never_read')
+        self.assertNotEqual(get_tag_generations(['never_read']), generation)
+
+class ObjectCacheTest(TestCase):
+    def tearDown(self):
+        get_object_tier(PROCESS_SCOPE).delete('components.tests:process')
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            threading.Event().wait(0.01)
+        self.fail("Timed out")
+
+    def compute_in_thread(self, obj_cache, func, outcomes):
+        def run():
+            try:
+                outcomes.append(obj_cache('key', func))
+            except ValueError, e:
+                outcomes.append(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    @override_settings(COMPONENT_PROFILING=True)
+    def test_waits_for_a_value_another_thread_is_computing(self):
+        obj_cache = ObjectCache()
+        computing, release = threading.Event(), threading.Event()
+        calls = []
+        def compute():
+            calls.append(1)
+            computing.set()
+            release.wait(5)
+            return 'value'
+
+        outcomes = []
+        first = self.compute_in_thread(obj_cache, compute, outcomes)
+        computing.wait(5)
+        second = self.compute_in_thread(obj_cache, compute, outcomes)
+        self.wait_for(lambda: obj_cache.stats.keys['key']['waits'] == 1)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(outcomes, ['value', 'value'])
+        self.assertEqual(obj_cache.stats.keys['key']['misses'], 1)
+        # The waiting thread found the value once it was done
+        self.assertEqual(obj_cache.stats.keys['key']['hits'], 1)
+
+    @override_settings(COMPONENT_PROFILING=True)
+    def test_waiting_thread_computes_the_value_if_the_other_one_failed(self):
+        obj_cache = ObjectCache()
+        computing, release = threading.Event(), threading.Event()
+        def fail():
+            computing.set()
+            release.wait(5)
+            raise ValueError("failed")
+
+        outcomes = []
+        first = self.compute_in_thread(obj_cache, fail, outcomes)
+        computing.wait(5)
+        second = self.compute_in_thread(obj_cache, lambda: 'value', outcomes)
+        self.wait_for(lambda: obj_cache.stats.keys['key']['waits'] == 1)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertIsInstance(outcomes[0], ValueError)
+        self.assertEqual(outcomes[1], 'value')
+
+    def test_key_needed_to_compute_itself_raises(self):
+        obj_cache = ObjectCache()
+        self.assertRaises(ComponentError, obj_cache, 'key',
+                          lambda: obj_cache('key', lambda: 'value'))
+
+    def test_process_scope_values_expire(self):
+        calls = []
+        def compute():
+            calls.append(1)
+            return 'value'
+        key = 'components.tests:process'
+        ObjectCache()(key, compute, scope=PROCESS_SCOPE, timeout=60)
+        ObjectCache()(key, compute, scope=PROCESS_SCOPE, timeout=60)
+        self.assertEqual(len(calls), 1)
+
+        get_object_tier(PROCESS_SCOPE).delete(key)
+        ObjectCache()(key, compute, scope=PROCESS_SCOPE, timeout=-1)
+        ObjectCache()(key, compute, scope=PROCESS_SCOPE, timeout=-1)
+        self.assertEqual(len(calls), 3)
+
+    def test_stats_are_only_recorded_when_profiling(self):
+        obj_cache = ObjectCache()
+        obj_cache('key', lambda: 'value')
+        obj_cache('key', lambda: 'value')
+        self.assertNotIsInstance(obj_cache.stats, ObjectCacheStats)
+        self.assertEqual(obj_cache.stats.totals()['hits'], 0)
+
+        with self.settings(COMPONENT_PROFILING=True):
+            obj_cache = ObjectCache()
+            obj_cache('key', lambda: 'value')
+            obj_cache('key', lambda: 'value')
+            self.assertEqual(obj_cache.stats.totals()['hits'], 1)
+
+    @override_settings(COMPONENT_OBJ_CACHE_MAX_BYTES=10000)
+    def test_budget_evicts_least_recently_used_recomputable_values(self):
+        obj_cache = ObjectCache()
+        obj_cache('fixed', lambda: 'x' * 20000)
+        obj_cache('r0', lambda: 'y' * 4000, recomputable=True)
+        obj_cache('r1', lambda: 'y' * 4000, recomputable=True)
+        obj_cache('r0', lambda: 'y' * 4000, recomputable=True)
+        obj_cache('r2', lambda: 'y' * 4000, recomputable=True)
+
+        self.assertEqual(sorted(obj_cache.data), ['fixed', 'r0', 'r2'])
+        # Only recomputable values are sized without profiling
+        self.assertEqual(sorted(obj_cache.sizes), ['r0', 'r2'])
+        self.assertTrue(obj_cache.total_size <= 10000)
+
+    def test_child_keys_are_the_same_for_str_and_unicode_kwargs(self):
+        self.assertEqual(
+            repr(ObjectCache.get_key_for_child_component('name', {'id': '7'})),
+            repr(ObjectCache.get_key_for_child_component(u'name', {u'id': u'7'})))
+        self.assertNotEqual(ObjectCache.get_key_for_child_component('name', {'id': 7}),
+                            ObjectCache.get_key_for_child_component('name', {'id': '7'}))
+
+class BatchComponentViewTest(ComponentsTestCase):
+    def test_all_guards_run_before_any_init(self):
+        del batch_events[:]
+        specs = [{'component_key': 'batched', 'kwargs': {'card_id': card_id},
+                  'param_key': get_param_key('batched', {'card_id': card_id})}
+                 for card_id in ('1', '2')]
+        request = RequestFactory().get('/components/batch/', {
+            'page_key': 'batch_page', 'components': json.dumps(specs),
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = AnonymousUser()
+        response = BatchComponentView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event for event, card_id in batch_events],
+                         ['guard', 'guard', 'init', 'init'])
+        self.assertEqual(len(json.loads(response.content)['actions']), 2)
+
+    def test_malformed_specs_are_rejected(self):
+        request = RequestFactory().get('/components/batch/', {
+            'page_key': 'batch_page',
+            'components': json.dumps([{'component_key': 'batched', 'kwargs': {'evil': 'x'}}]),
+        })
+        request.user = AnonymousUser()
+        self.assertEqual(BatchComponentView.as_view()(request).status_code, 400)
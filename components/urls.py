@@ -1,7 +1,7 @@
 
 from django.conf.urls import url, patterns
 
-from .views import ComponentView, Component, COMPONENT_KEYS, PAGE_KEYS
+from .views import BatchComponentView, ComponentView, Component, COMPONENT_KEYS, PAGE_KEYS
 
 def component_url(regex,
                   ComponentClass,
@@ -52,4 +52,7 @@ def component_url(regex,
     return url(regex, view, kwargs=kwargs, name=name, prefix=prefix)
 
 
-urlpatterns = patterns('',)
+urlpatterns = patterns(
+    '',
+    url(r'^batch/$', BatchComponentView.as_view(), name='components_batch'),
+)
@@ -1,16 +1,94 @@
 
+import os
 import re
+import sys
+import threading
+import types
+from collections import OrderedDict
+from hashlib import md5
 
 from django.utils.functional import memoize
+from django.utils.translation import get_language
 from django.utils.crypto import get_random_string
 from django.conf import settings
+from django.db.models.query import QuerySet
+from django.template import TemplateDoesNotExist
+from django.template.loader import find_template_loader
 from django.core.urlresolvers import (
-    RegexURLResolver, NoReverseMatch,
+    RegexURLResolver, NoReverseMatch, reverse,
     get_callable, normalize, force_unicode,
     get_urlconf, get_script_prefix,
     get_ns_resolver, iri_to_uri,
 )
 
+_ATOMIC_TYPES = (basestring, int, long, float, types.NoneType)
+_SKIPPED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                  types.MethodType, types.BuiltinFunctionType)
+
+def estimate_size(value, max_objects=10000):
+    """
+    A rough estimate of the memory `value` uses, in bytes: the
+    `sys.getsizeof` of it and of everything it holds (container items,
+    instance `__dict__`s and the results of evaluated QuerySets), counting
+    shared objects once and giving up after `max_objects` objects.
+    """
+    seen = set()
+    size = 0
+    pending = [value]
+    while pending and len(seen) < max_objects:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        try:
+            size += sys.getsizeof(obj)
+        except TypeError:
+            continue
+        if isinstance(obj, _ATOMIC_TYPES):
+            continue
+        if isinstance(obj, dict):
+            pending.extend(obj.iterkeys())
+            pending.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        elif isinstance(obj, QuerySet):
+            if obj._result_cache is not None:
+                pending.append(obj._result_cache)
+        elif hasattr(obj, '__dict__'):
+            pending.append(obj.__dict__)
+    return size
+
+_FRAMEWORK_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+_framework_templates = {}
+
+def _find_template_source(loader, template_name):
+    # The cached loader doesn't load sources itself
+    for inner_loader in getattr(loader, 'loaders', None) or [loader]:
+        try:
+            return inner_loader.load_template_source(template_name)[1]
+        except (TemplateDoesNotExist, NotImplementedError):
+            pass
+    return None
+
+def is_framework_template(template_name):
+    """
+    True if `template_name` resolves to the framework's own copy of the
+    template, ie. the project doesn't override it. Memoized for the
+    template settings.
+    """
+    memo_key = (template_name, repr(settings.TEMPLATE_LOADERS), repr(settings.TEMPLATE_DIRS))
+    if memo_key not in _framework_templates:
+        own_path = os.path.join(_FRAMEWORK_TEMPLATE_DIR, template_name)
+        is_own = False
+        for loader_name in settings.TEMPLATE_LOADERS:
+            loader = find_template_loader(loader_name)
+            source_name = loader and _find_template_source(loader, template_name)
+            if source_name:
+                is_own = os.path.abspath(source_name) == os.path.abspath(own_path)
+                break
+        _framework_templates[memo_key] = is_own
+    return _framework_templates[memo_key]
+
 def random_session_key(session, prefix=''):
     key = None
     while not key or (prefix + key) in session:
@@ -24,6 +102,40 @@ class BRegexURLResolver(RegexURLResolver):
     from django/core/urlresolvers.py
     modified as noted
     """
+    def __init__(self, *args, **kwargs):
+        super(BRegexURLResolver, self).__init__(*args, **kwargs)
+        self._reverse_index = {}
+
+    def _get_reverse_entries(self, lookup_view, _prefix):
+        """
+        Everything _reverse_with_prefix needs from the reverse_dict
+        possibilities of lookup_view, computed (and the patterns compiled)
+        once per view, prefix and language: a list of
+        (format string, positional arg names, required kwarg names,
+        defaults, compiled pattern) tuples.
+        """
+        index_key = (lookup_view, _prefix, get_language())
+        try:
+            return self._reverse_index[index_key]
+        except KeyError:
+            pass
+
+        prefix_norm, prefix_args = normalize(_prefix)[0]
+        entries = []
+        for possibility, pattern, defaults in self.reverse_dict.getlist(lookup_view):
+            regex = re.compile(u'^%s%s' % (_prefix, pattern), re.UNICODE)
+            for result, params in possibility:
+                entries.append((
+                    prefix_norm + result,
+                    prefix_args + params,
+                    # ## MODS: kwargs only need to include these
+                    tuple(set(params + prefix_args) - set(defaults.keys())),
+                    defaults.items(),
+                    regex,
+                ))
+        self._reverse_index[index_key] = entries
+        return entries
+
     def _reverse_with_prefix(self, lookup_view, _prefix, *args, **kwargs):
         if args and kwargs:
             raise ValueError("Don't mix *args and **kwargs in call to reverse()!")
@@ -31,36 +143,38 @@ class BRegexURLResolver(RegexURLResolver):
             lookup_view = get_callable(lookup_view, True)
         except (ImportError, AttributeError), e:
             raise NoReverseMatch("Error importing '%s': %s." % (lookup_view, e))
-        possibilities = self.reverse_dict.getlist(lookup_view)
-        prefix_norm, prefix_args = normalize(_prefix)[0]
-        for possibility, pattern, defaults in possibilities:
-            for result, params in possibility:
-                if args:
-                    # ## START MODS
-                    expected_length = len(params) + len(prefix_args)
-                    if len(args) < expected_length:
-                        continue
-                    args = args[:expected_length]
-                    # ## END MODS
-
-                    unicode_args = [force_unicode(val) for val in args]
-                    candidate = (prefix_norm + result) % dict(zip(prefix_args + params, unicode_args))
-                else:
-                    # ## START MODS
-                    if set(params + defaults.keys() + prefix_args) - set(kwargs.keys() + defaults.keys()):
-                        continue
-                    # ## END MODS
-                    matches = True
-                    for k, v in defaults.items():
-                        if kwargs.get(k, v) != v:
-                            matches = False
-                            break
-                    if not matches:
-                        continue
-                    unicode_kwargs = dict([(k, force_unicode(v)) for (k, v) in kwargs.items()])
-                    candidate = (prefix_norm + result) % unicode_kwargs
-                if re.search(u'^%s%s' % (_prefix, pattern), candidate, re.UNICODE):
-                    return candidate
+        for candidate_format, arg_names, required, defaults, regex in \
+                self._get_reverse_entries(lookup_view, _prefix):
+            if args:
+                # ## START MODS
+                expected_length = len(arg_names)
+                if len(args) < expected_length:
+                    continue
+                args = args[:expected_length]
+                # ## END MODS
+
+                unicode_args = [force_unicode(val) for val in args]
+                candidate = candidate_format % dict(zip(arg_names, unicode_args))
+            else:
+                # ## START MODS
+                matches = True
+                for k in required:
+                    if k not in kwargs:
+                        matches = False
+                        break
+                if not matches:
+                    continue
+                # ## END MODS
+                for k, v in defaults:
+                    if kwargs.get(k, v) != v:
+                        matches = False
+                        break
+                if not matches:
+                    continue
+                unicode_kwargs = dict([(k, force_unicode(v)) for (k, v) in kwargs.items()])
+                candidate = candidate_format % unicode_kwargs
+            if regex.search(candidate):
+                return candidate
         # lookup_view can be URL label, or dotted path, or callable, Any of
         # these can be passed in at the top, but callables are not friendly in
         # error messages.
@@ -84,7 +198,99 @@ def get_resolver(urlconf):
     return BRegexURLResolver(r'^/', urlconf)
 get_resolver = memoize(get_resolver, _b_resolver_cache, 1)
 
+class LRUCache(object):
+    """
+    A small thread safe LRU cache used to memoize url related lookups.
+    The maximum size is read from the `size_setting` setting.
+    """
+    def __init__(self, size_setting, default_size):
+        self.size_setting = size_setting
+        self.default_size = default_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.pop(key, None)
+            if value is not None:
+                # re-insert to mark it as most recently used
+                self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        max_size = getattr(settings, self.size_setting, self.default_size)
+        with self.lock:
+            self.data[key] = value
+            while len(self.data) > max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+def get_memo_key(*parts):
+    """
+    Returns a hashable key for `parts`, or None if they aren't hashable.
+    Dicts are included as frozensets of their items.
+    """
+    key = tuple(frozenset(part.iteritems()) if isinstance(part, dict) else part
+                for part in parts)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+_fuzzy_reverse_cache = LRUCache('COMPONENT_REVERSE_CACHE_SIZE', 2048)
+
+def clear_fuzzy_reverse_cache():
+    _fuzzy_reverse_cache.clear()
+
 def fuzzy_reverse(viewname, urlconf=None, args=None, kwargs=None, prefix=None, current_app=None):
+    """
+    Memoized `_fuzzy_reverse`: the last COMPONENT_REVERSE_CACHE_SIZE
+    (default 2048) results are kept in an LRU cache keyed on everything the
+    result depends on. Reversing callables or unhashable arguments isn't
+    memoized.
+    """
+    if urlconf is None:
+        urlconf = get_urlconf()
+    if prefix is None:
+        prefix = get_script_prefix()
+
+    memo_key = None
+    if isinstance(viewname, basestring):
+        memo_key = get_memo_key(viewname, urlconf, tuple(args or ()), kwargs or {},
+                                 prefix, current_app, get_language())
+    if memo_key is None:
+        return _fuzzy_reverse(viewname, urlconf, args, kwargs, prefix, current_app)
+
+    url = _fuzzy_reverse_cache.get(memo_key)
+    if url is None:
+        url = _fuzzy_reverse(viewname, urlconf, args, kwargs, prefix, current_app)
+        _fuzzy_reverse_cache.set(memo_key, url)
+    return url
+
+_param_key_cache = LRUCache('COMPONENT_PARAM_KEY_CACHE_SIZE', 4096)
+
+def get_param_key(component_key, kwargs, current_app=None):
+    """
+    The 'parameterized key' of a component: a hash of its url reversed with
+    `kwargs`. Memoized in an LRU cache of COMPONENT_PARAM_KEY_CACHE_SIZE
+    (default 4096) keys.
+
+    Raises NoReverseMatch like `reverse`.
+    """
+    memo_key = get_memo_key(component_key, kwargs or {}, current_app,
+                             get_urlconf(), get_script_prefix(), get_language())
+    param_key = _param_key_cache.get(memo_key) if memo_key is not None else None
+    if param_key is None:
+        param_key = md5(reverse(component_key, kwargs=kwargs, current_app=current_app)).hexdigest()
+        if memo_key is not None:
+            _param_key_cache.set(memo_key, param_key)
+    return param_key
+
+def _fuzzy_reverse(viewname, urlconf=None, args=None, kwargs=None, prefix=None, current_app=None):
     """
     from django/core/urlresolvers.py
     Unmodified reverse (just need to use our modified version of get_resolver)
@@ -1,27 +1,74 @@
 
+import copy
 import json
+import logging
+import thread
+import threading
+import time
 import urllib
+from calendar import timegm
+from collections import OrderedDict
+from functools import partial
 from hashlib import md5
 
 from django.contrib import messages
 from django.conf import settings
-from django.core.urlresolvers import reverse, NoReverseMatch
+from django.db import connections
+from django.core.urlresolvers import get_script_prefix, resolve, reverse, NoReverseMatch
 from django.shortcuts import render
 from django.http import (
     HttpResponse,
     HttpResponseRedirect,
     HttpResponseNotFound,
     HttpResponseBadRequest,
+    HttpResponseNotModified,
     QueryDict,
 )
+try:
+    from django.http import StreamingHttpResponse
+    STREAMING_RESPONSES = True
+except ImportError:
+    # Django < 1.5 streams any HttpResponse with an iterator as its content
+    STREAMING_RESPONSES = False
+
+    class StreamingHttpResponse(HttpResponse):
+        """
+        Reading `content` uses up the iterator, leaving nothing to send, so
+        keep what was read: middleware that reads it (eg. CommonMiddleware
+        with USE_ETAGS) gets the whole page, which is then sent unstreamed.
+        """
+        def _get_content(self):
+            content = HttpResponse.content.fget(self)
+            if self._base_content_is_iter:
+                self._set_content(content)
+            return content
+
+        content = property(_get_content, HttpResponse._set_content)
 from django.views.generic import View
 from django.template.loader import render_to_string
 from django.template import RequestContext, Context
 from django.utils.safestring import mark_safe
-from django.utils.functional import cached_property
-
-from .utils import fuzzy_reverse, random_session_key
+from django.utils.html import escape
+from django.utils.crypto import get_random_string
+from django.utils.encoding import force_unicode
+from django.utils.functional import cached_property, lazy
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils import translation
+
+from .utils import (
+    estimate_size, fuzzy_reverse, get_memo_key, get_param_key, is_framework_template,
+    random_session_key,
+)
 from .forms import BForm
+from .concurrency import get_pool, in_worker_thread, run_all, run_in_background, run_unordered
+from .decorators import prime_batch_obj_caches
+from .profiling import ComponentProfiler, NULL_PHASE, profiling_enabled
+from .cache import (
+    get_component_cache, get_fragment_cache_key, get_prefetch_cache_key, invalidate_tags,
+    get_object_tier, get_object_timeout, REQUEST_SCOPE,
+)
+
+logger = logging.getLogger(__name__)
 
 COMPONENT_KEYS = {'to_component_class': {}, 'from_component_class': {}}
 PAGE_KEYS = {'to_page_class': {}, 'from_page_class': {}}
@@ -47,43 +94,113 @@ def should_load_partial_page(request):
     else:
         return request.is_ajax() and request.REQUEST.get('force_full_page', 'false') != 'true'
 
-class StrippedRequestInfo(object):
-    def __init__(self, request_obj, page_key, kwargs, POST=None, passive=False):
-        # request_obj can be a requests or a StrippedRequestInfo
+# don't show the no-js warning to search bots -- they see it 5 times
+# on a page and think it's important
+SEARCH_BOTS = (
+    'googlebot', 'mediapartners', 'adsbot', # google
+    'bingbot', 'adidxbot', 'msnbot', 'bingpreview', # bing, yahoo
+)
 
-        self.user = request_obj.user
-        self.method = request_obj.method
+DEFER_TEMPLATE = 'includes/defer_loading.html'
+
+# The GET parameter with the page load's nonce, see Component.prefetch_on_server
+PREFETCH_PARAM = 'cmp_prefetch'
+
+# The markup of includes/defer_loading.html, used instead of rendering it
+# unless the project overrides it (see Component._render_deferred)
+DEFER_LOADING_HTML = u"""
+<div class="cmp-deferred"
+    data-cmp_url="%(url)s?%(get_params)s"
+    data-cmp_page_key="%(page_key)s"
+    data-cmp_component_key="%(component_key)s"
+    data-cmp_priority="%(priority)d"%(prefetch_attr)s
+    %(param_key_attr)s>
+
+    <div class="js hide-on-error"></div>
+%(no_js)s</div>"""
+
+DEFER_NO_JS_HTML = u"""
+    <div class="no-js">
+        <p>
+            <strong>This section requires Javascript.</strong><br>
+            You are seeing this because something didn't load right. We suggest you, (a) try
+            refreshing the page, (b) enabling javascript if it is disabled on your browser and,
+            finally, (c) <a href="%(page_url)s?no_js=true">loading the
+            non-javascript version of this page</a>. We're sorry about the hassle.
+        </p>
+    </div>
+"""
+
+def get_defer_request_info(request):
+    """
+    Returns whether the request comes from a search bot, and the query
+    string deferred components are loaded with. Memoized on the request,
+    since every deferred component on a page needs them.
+    """
+    info = getattr(request, '_components_defer_info', None)
+    if info is None:
+        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
+        info = (any(bot in user_agent for bot in SEARCH_BOTS),
+                request.META.get('QUERY_STRING', '').replace('force_full_page=true', '_=_'))
+        try:
+            request._components_defer_info = info
+        except AttributeError:
+            # eg. a StrippedRequestInfo
+            pass
+    return info
+
+class StrippedRequestInfo(object):
+    """
+    What Components see of the request: the request itself, with its own
+    page_key, url kwargs, passive flag and POST data. Everything else is
+    read from the request when it's used, so these are cheap to make (one
+    per component, child and dependent).
+    """
+    __slots__ = ('_request', 'page_key', '_kwargs', 'passive', '_POST', '_full_path')
 
-        # Passes the following bound functions to the other object.
-        # Should stay bound to the original object:
-        self.is_ajax = request_obj.is_ajax
-        self.is_secure = request_obj.is_secure
+    # Attributes read from the request
+    request_attributes = frozenset(['user', 'method', 'is_ajax', 'is_secure', 'GET', 'META',
+                                    'LANGUAGE_CODE', 'session', 'path'])
 
-        self.is_execute_request = getattr(request_obj, 'is_execute_request', False)
+    def __init__(self, request_obj, page_key, kwargs, POST=None, passive=False):
+        # request_obj can be a requests or a StrippedRequestInfo
+        if isinstance(request_obj, StrippedRequestInfo):
+            request_obj = request_obj._request
 
+        self._request = request_obj
         self.page_key = page_key
         self.passive = passive
-        self.GET = request_obj.GET
-        self.META = request_obj.META
-        if hasattr(request_obj, 'LANGUAGE_CODE'):
-            self.LANGUAGE_CODE = request_obj.LANGUAGE_CODE
-        self.session = request_obj.session
-        self.path = request_obj.path
-        if hasattr(request_obj, 'get_full_path'):
-            # probably the same as checking isinstance(StrippedRequestInfo)
-            # but I don't want to change logic at this point.
-            self.full_path = request_obj.get_full_path()
-        else:
-            self.full_path = request_obj.full_path
-
         self._kwargs = kwargs
+        self._full_path = None
 
         # make sure we didn't just put None in one of these
         # This test may be outdated now that we're passing GET around for passive
         assert self.passive or POST is not None
 
-        if POST is not None:  # remember {} is not the same as None
-            self.POST = POST
+        # remember {} is not the same as None, which means there is no POST
+        self._POST = POST
+
+    def __getattr__(self, name):
+        if name in StrippedRequestInfo.request_attributes:
+            return getattr(self._request, name)
+        raise AttributeError("'StrippedRequestInfo' object has no attribute '%s'" % name)
+
+    @property
+    def POST(self):
+        # Never the request's POST: passive request infos don't have one
+        if self._POST is None:
+            raise AttributeError("'StrippedRequestInfo' object has no attribute 'POST'")
+        return self._POST
+
+    @property
+    def full_path(self):
+        if self._full_path is None:
+            self._full_path = self._request.get_full_path()
+        return self._full_path
+
+    @property
+    def is_execute_request(self):
+        return getattr(self._request, 'is_execute_request', False)
 
 class ComponentBadRequestData(BaseException):
     pass
@@ -91,36 +208,319 @@ class ComponentBadRequestData(BaseException):
 class ComponentError(BaseException):
     pass
 
+class ObjectCacheStats(object):
+    """
+    How often each ObjectCache key was found (`hits`), computed (`misses`),
+    waited for while another thread computed it (`waits`) or evicted
+    (`evictions`), the seconds spent computing it (`time`) and, if sizes
+    are estimated, the estimated bytes of its latest value (`size`).
+    """
+    def __init__(self):
+        self.keys = {}
+
+    def _get(self, key):
+        stats = self.keys.get(key)
+        if stats is None:
+            stats = self.keys[key] = {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0,
+                                      'time': 0.0, 'size': None}
+        return stats
+
+    def sized(self, key, size):
+        self._get(key)['size'] = size
+
+    def evict(self, key):
+        self._get(key)['evictions'] += 1
+
+    def hit(self, key):
+        self._get(key)['hits'] += 1
+
+    def wait(self, key):
+        self._get(key)['waits'] += 1
+
+    def miss(self, key, seconds):
+        stats = self._get(key)
+        stats['misses'] += 1
+        stats['time'] += seconds
+
+    def totals(self):
+        totals = {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0, 'time': 0.0}
+        for stats in self.keys.itervalues():
+            for name in totals:
+                totals[name] += stats[name]
+        return totals
+
+    def slowest(self, count=None):
+        """
+        (key, stats) pairs, the keys that took longest to compute first.
+        """
+        return sorted(self.keys.iteritems(), key=lambda item: -item[1]['time'])[:count]
+
+    def biggest(self, count=None):
+        """
+        (key, size) pairs of the keys with an estimated size, biggest first.
+        """
+        sizes = [(key, stats['size']) for key, stats in self.keys.iteritems()
+                 if stats['size'] is not None]
+        return sorted(sizes, key=lambda item: -item[1])[:count]
+
+    def as_dict(self):
+        return dict((unicode(key), dict(stats)) for key, stats in self.keys.iteritems())
+
+class _NullObjectCacheStats(object):
+    """
+    Stands in for ObjectCacheStats when the request isn't profiled, so
+    cache accesses don't pay for per-key bookkeeping nobody reads.
+    """
+    def sized(self, key, size):
+        pass
+
+    def evict(self, key):
+        pass
+
+    def hit(self, key):
+        pass
+
+    def wait(self, key):
+        pass
+
+    def miss(self, key, seconds):
+        pass
+
+    def totals(self):
+        return {'hits': 0, 'misses': 0, 'waits': 0, 'evictions': 0, 'time': 0.0}
+
+    def slowest(self, count=None):
+        return []
+
+    def biggest(self, count=None):
+        return []
+
+    def as_dict(self):
+        return {}
+
+NULL_OBJECT_CACHE_STATS = _NullObjectCacheStats()
+
+class _Flight(object):
+    """
+    A value an ObjectCache is computing in the thread `owner`.
+    """
+    def __init__(self):
+        self.owner = thread.get_ident()
+        self.done = threading.Event()
+
 class ObjectCache(object):
+    """
+    Caches values for the length of the request, and optionally (depending
+    on the `scope` a value is requested with) beyond it:
+
+        REQUEST_SCOPE: only for this request (the default)
+        PROCESS_SCOPE: also in an LRU cache shared by this process
+        SHARED_SCOPE: also in the Django cache (see `SharedObjectCache`)
+
+    Values are always looked up in the request's own dict first.
+
+    Components initialized on a pool share the request's ObjectCache, so
+    each value is only computed once: a thread asking for a key that
+    another thread is computing waits for its result (or, if computing it
+    failed, computes it again itself). Functions computing a value
+    shouldn't wait on a pool whose threads could be waiting for that value.
+
+    When the request is profiled (the COMPONENT_PROFILING setting), `stats`
+    counts the hits, misses and compute time of every key, and is reported
+    with the request's profile (see ComponentProfiler). Otherwise it's a
+    stand-in that records nothing.
+
+    With the COMPONENT_OBJ_CACHE_MAX_BYTES setting, the size of every value
+    requested with `recomputable=True` is estimated (see `estimate_size`),
+    and once they add up to more than that, the least recently used of them
+    are dropped (to be computed again if they are needed again) until they
+    fit. Other values are never dropped, and only count towards the budget
+    when the request is profiled, which estimates the size of every value
+    for the biggest keys report.
+    """
     def __init__(self, init=None):
         self.data = {}
+        self.lock = threading.Lock()
+        # Keys being computed, see _Flight
+        self.flights = {}
+        profiled = profiling_enabled()
+        self.stats = ObjectCacheStats() if profiled else NULL_OBJECT_CACHE_STATS
+        self.max_bytes = getattr(settings, 'COMPONENT_OBJ_CACHE_MAX_BYTES', None)
+        self.size_all_values = profiled
+        # Estimated size of every value, and their total
+        self.sizes = {}
+        self.total_size = 0
+        # Sizes of the values that can be dropped, least recently used first
+        self.recomputable = OrderedDict()
+        self.warned_over_budget = False
+        # The request's ComponentProfiler, if it is profiled
+        self.profiler = None
+        # Memoized Component guard results, see Component.memoize_guard
+        self.guard_results = {}
+        # Deferred components rendered as placeholders in this request that
+        # should be prefetched, see Component.prefetch_on_server
+        self.prefetch_components = []
+        self.prefetch_nonce = None
+        # scope of every key that was stored beyond the request
+        self.scopes = {}
         if init:
             for key in init:
                 if init[key] is not None:
-                    self.data[key] = init[key]
+                    self._store(key, init[key], size=self._estimate_size(init[key]))
+
+
+    def __call__(self, key, func, scope=REQUEST_SCOPE, timeout=None, recomputable=False):
+        while True:
+            with self.lock:
+                if key in self.data:
+                    self.stats.hit(key)
+                    if key in self.recomputable:
+                        self.recomputable[key] = self.recomputable.pop(key)
+                    return self.data[key]
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = self.flights[key] = _Flight()
+                    break
+                if flight.owner == thread.get_ident():
+                    raise ComponentError("obj_cache key %r is needed to compute itself" % (key,))
+                self.stats.wait(key)
+            flight.done.wait()
+
+        started = time.time()
+        try:
+            value = self._compute(key, func, scope, timeout)
+        except BaseException:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+            raise
 
+        elapsed = time.time() - started
+        size = self._estimate_size(value, recomputable)
+        with self.lock:
+            self.stats.miss(key, elapsed)
+            self._store(key, value, recomputable, size)
+            if scope != REQUEST_SCOPE:
+                self.scopes[key] = scope
+            del self.flights[key]
+        flight.done.set()
+        return value
 
-    def __call__(self, key, func):
-        if key not in self.data:
-            self.data[key] = func()
-        return self.data[key]
+    def _estimate_size(self, value, recomputable=False):
+        """
+        The estimated size of `value`, or None if it doesn't need one.
+        Called without the lock held, since estimating walks the value.
+        """
+        if self.size_all_values or (recomputable and self.max_bytes):
+            return estimate_size(value)
+        return None
 
-    def reset(self, key):
-        if key in self.data:
+    def _store(self, key, value, recomputable=False, size=None):
+        # Called with the lock held (or from __init__)
+        self.data[key] = value
+        if key in self.sizes:
+            self._forget_size(key)
+        if size is None:
+            return
+        self.sizes[key] = size
+        self.total_size += size
+        self.stats.sized(key, size)
+        if recomputable:
+            self.recomputable[key] = size
+        if self.max_bytes and self.total_size > self.max_bytes:
+            self._evict(keep=key)
+
+    def _forget_size(self, key):
+        self.total_size -= self.sizes.pop(key, 0)
+        self.recomputable.pop(key, None)
+
+    def _evict(self, keep):
+        """
+        Drops the least recently used recomputable values (other than
+        `keep`) until the total size is within COMPONENT_OBJ_CACHE_MAX_BYTES.
+        """
+        for key in list(self.recomputable):
+            if self.total_size <= self.max_bytes:
+                return
+            if key == keep:
+                continue
             del self.data[key]
+            self._forget_size(key)
+            self.stats.evict(key)
+
+        if self.total_size > self.max_bytes and not self.warned_over_budget:
+            self.warned_over_budget = True
+            logger.warning("ObjectCache holds about %d bytes, over COMPONENT_OBJ_CACHE_MAX_BYTES "
+                           "(%d) with nothing left to evict. Biggest keys: %r",
+                           self.total_size, self.max_bytes,
+                           sorted(self.sizes.iteritems(), key=lambda item: -item[1])[:10])
+
+    def get_prefetch_nonce(self):
+        """
+        Identifies this page load to the deferred requests of its prefetched
+        components, see Component.prefetch_on_server.
+        """
+        with self.lock:
+            if self.prefetch_nonce is None:
+                self.prefetch_nonce = get_random_string(12)
+        return self.prefetch_nonce
+
+    def _compute(self, key, func, scope, timeout):
+        if scope == REQUEST_SCOPE:
+            return func()
+        tier = get_object_tier(scope)
+        found, value = tier.get(key)
+        if not found:
+            value = func()
+            tier.set(key, value, get_object_timeout(timeout))
+        return value
+
+    def reset(self, key, scope=None):
+        """
+        Removes `key` from this request's cache, and from the cache of
+        `scope` (by default, the scope it was stored with in this request).
+        """
+        with self.lock:
+            self.data.pop(key, None)
+            self._forget_size(key)
+            scope = scope or self.scopes.pop(key, None)
+        if scope and scope != REQUEST_SCOPE:
+            get_object_tier(scope).delete(key)
 
     def set(self, key, val):
         """
         Like __call__, but doesn't take a function.
         Useful if you already have the object (example: when it's initially created)
         """
-        self.data[key] = val
+        size = self._estimate_size(val)
+        with self.lock:
+            self._store(key, val, size=size)
         return val
 
     @staticmethod
     def get_key_for_child_component(raw_key, kwargs):
-        kwargs = kwargs or {}
-        return u"%s[%s]" % (raw_key, md5(unicode(sorted(kwargs.items()))).hexdigest())
+        """
+        The key of `raw_key` for a component with `kwargs`: a
+        (raw_key, sorted kwargs items) tuple, or, with the
+        COMPONENT_OBJ_CACHE_STRING_KEYS setting (or unhashable kwargs), the
+        u"raw_key[md5 of the kwargs]" string used before.
+
+        Bytestring names and values are made unicode in the tuple, so that
+        'id' and u'id' give the same SharedObjectCache key (which hashes
+        the key's repr).
+        """
+        items = tuple(sorted(kwargs.iteritems())) if kwargs else ()
+        if not getattr(settings, 'COMPONENT_OBJ_CACHE_STRING_KEYS', False):
+            key = (force_unicode(raw_key),
+                   tuple((force_unicode(name),
+                          force_unicode(value) if isinstance(value, str) else value)
+                         for name, value in items))
+            try:
+                hash(key)
+                return key
+            except TypeError:
+                pass
+        return u"%s[%s]" % (raw_key, md5(unicode(list(items))).hexdigest())
 
 class AttributeDict(dict):
     """
@@ -162,6 +562,40 @@ class ComponentsRenderDict(dict):
         self.accessed_keys.append(key)
         return value
 
+class PageComponentsDict(dict):
+    """
+    A Page's `components`. When the Page initializes its components on a
+    pool (COMPONENT_INIT_POOL_SIZE), the ones added in `set_components` are
+    only scheduled, so reading one back initializes everything scheduled so
+    far first, as if they had been initialized as they were added.
+    """
+    def __init__(self, page):
+        super(PageComponentsDict, self).__init__()
+        self.page = page
+
+    def __missing__(self, key):
+        if not self.page.is_scheduled(key):
+            raise KeyError(key)
+        self.page.run_scheduled_components()
+        return super(PageComponentsDict, self).__getitem__(key)
+
+    def __contains__(self, key):
+        return super(PageComponentsDict, self).__contains__(key) or self.page.is_scheduled(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+def prime_child_components(children, obj_cache):
+    """
+    Loads the batch_obj_cache values of all the (component, request_info)
+    `children` that will run `final`, at once.
+    """
+    prime_batch_obj_caches(
+        [component for component, child_request_info in children
+         if (not component.guard_fail
+             and component.cached_render is None
+             and not component.defer_this_request(child_request_info, is_child=True))],
+        obj_cache)
 
 class FrameworkBaseMixin(object):
     def check_guard(self, component):
@@ -181,7 +615,51 @@ class FrameworkBaseMixin(object):
                      or self.user.profile.flags.is_discussions_moderator))
 
     def get_param_key(self, component_key, kwargs):
-        return md5(reverse(component_key, kwargs=kwargs)).hexdigest()
+        return get_param_key(component_key, kwargs)
+
+    def get_child_obj_cache_key(self, raw_key):
+        """
+        `ObjectCache.get_key_for_child_component` for this instance's
+        kwargs, memoized so that reading an obj_cache property again is a
+        single lookup.
+        """
+        keys = self.__dict__.get('_child_obj_cache_keys')
+        if keys is None:
+            keys = self._child_obj_cache_keys = {}
+        key = keys.get(raw_key)
+        if key is None:
+            key = keys[raw_key] = self.obj_cache.get_key_for_child_component(raw_key, self.kwargs)
+        return key
+
+    def run_concurrently(self, *funcs):
+        """
+        Calls the functions and returns their results, in order. With the
+        COMPONENT_IO_POOL_SIZE setting they run concurrently, which lets
+        `init`, `handler` or `final` overlap independent I/O (queries,
+        requests to other services...):
+
+            def init(self):
+                self.ctx.profile, self.ctx.feed = self.run_concurrently(
+                    lambda: profile_service.get(self.user.pk),
+                    lambda: list(FeedItem.objects.filter(user=self.user)[:10]))
+
+        The first exception raised is re-raised once they have all finished.
+        The functions shouldn't construct components.
+        """
+        return run_all(get_pool('COMPONENT_IO_POOL_SIZE'), funcs)
+
+    def component_profile_phase(self, phase):
+        """
+        Times `phase` of this Component or Page (use it in a `with`) when the
+        request is being profiled, see components.profiling.
+        """
+        profiler = self.obj_cache.profiler
+        if profiler is None:
+            return NULL_PHASE
+        return profiler.phase(self, phase, self.get_profile_label())
+
+    def get_profile_label(self):
+        return self.__class__.__name__
 
 class Component(FrameworkBaseMixin):
     """
@@ -252,7 +730,77 @@ class Component(FrameworkBaseMixin):
     # the form.
     override_page_key = False
 
-    def __init__(self, request_info, obj_cache, response_message=None, guard_only=False, param_key=None):
+    # Component classes that must be initialized before this one when both
+    # are added to a Page that initializes its components concurrently
+    # (COMPONENT_INIT_POOL_SIZE). For instance, if this component reads
+    # obj_cache values that another component sets up in its `init`.
+    init_after = ()
+
+    # Set cache_timeout (in seconds) to cache the rendered output of this
+    # component across requests. The cache key is built from the
+    # component_key, param_key, kwargs and page_key, plus the request_info
+    # attributes named in cache_vary_on (dotted paths like 'user.pk' or
+    # 'LANGUAGE_CODE') and the request's query string. On a hit, init,
+    # final, init_child_components and the template render are all skipped.
+    # Renders that use the CSRF token, or contain prefetched placeholders,
+    # are never cached.
+    cache_timeout = None
+    cache_vary_on = ()
+
+    # Tags for the data the cached render depends on. They are formatted
+    # with the component's kwargs (eg. 'attendee:%(attendee_id)s'), and
+    # invalidating a tag (see `invalidate_cache_tags`) invalidates every
+    # cached render with that tag. Adding a component as a dependent
+    # component invalidates its tags.
+    cache_tags = ()
+
+    # Set to True to stream this component on Pages with `streaming` set:
+    # it is then initialized and rendered after the rest of the page has
+    # been sent to the browser.
+    streamed = False
+
+    # Set to True to memoize the result of `guard` (including the guards of
+    # the dependent components it guards) for the rest of the request per
+    # component class, param_key, kwargs, page_key, passive/active and
+    # user, so a component built more than once in a request only runs its
+    # guard once. Only for guards that depend on nothing else and don't set
+    # attributes that the rest of the component uses. Results memoized
+    # before a handler ran aren't reused after it, and dependent components
+    # always run their guards.
+    memoize_guard = False
+
+    # Deferred components are rendered as a placeholder that the javascript
+    # replaces with the component. Unless the project overrides
+    # includes/defer_loading.html, the placeholder is built without the
+    # template engine. A template can also be set here or with the
+    # COMPONENT_DEFER_TEMPLATE setting, which is rendered with
+    # `component_info`, `get_params` and `search_bot`.
+    defer_template_name = None
+
+    # How soon this (deferred or streamed) component should be loaded
+    # compared to the others on the page, higher first. Streamed components
+    # and the components of a batch request are initialized in this order,
+    # and the placeholder of deferred components has it as
+    # `data-cmp_priority` for the javascript.
+    defer_priority = 0
+
+    # Set to True to hint (as `data-cmp_prefetch`) that a deferred
+    # component should be loaded once the page has loaded, even if it isn't
+    # in view yet.
+    defer_prefetch = False
+
+    # Set to True to start initializing and rendering this component in a
+    # background thread (COMPONENT_PREFETCH_POOL_SIZE) as soon as a response
+    # with its deferred placeholder has been sent. The render is cached for
+    # COMPONENT_PREFETCH_TIMEOUT seconds for the user's session and that
+    # page load, and the deferred request from that page then only runs the
+    # guards and uses the cached render. Only use this for components that are always loaded (eg.
+    # above the fold) and whose render only depends on the request's user,
+    # kwargs and language.
+    prefetch_on_server = False
+
+    def __init__(self, request_info, obj_cache, response_message=None, guard_only=False, param_key=None,
+                 refresh_fragment_cache=False, dependent=False):
         self.component_key = self.get_component_key()
 
         self.request_info = request_info
@@ -282,9 +830,34 @@ class Component(FrameworkBaseMixin):
 
         self.obj_cache = obj_cache
 
+        # See cache_timeout. refresh_fragment_cache re-renders (and re-caches)
+        # the component even if there is a cached render.
+        self.refresh_fragment_cache = refresh_fragment_cache
+        self.fragment_cache_key = None
+        self.cached_render = None
+        # Set when this render (or a child's) contains something specific to
+        # this request, like the CSRF token, so it mustn't be cached.
+        self.render_uncacheable = False
+
+        # Set by Page for streamed components that still have to be
+        # initialized and rendered.
+        self.stream_pending = False
+
+        # See get_url and get_page_url
+        self._url = None
+        self._page_url = None
+
+        # guard_only components only run their guards, they can be
+        # initialized later with `promote`.
+        self.guard_only = guard_only
+
+        # Dependent components are built after the handler, see
+        # `add_dependent_component`
+        self.dependent = dependent
+
         self.run_guards()
-        if not self.guard_fail and not guard_only and not self.defer_this_request(request_info):
-            self.init()
+        if not guard_only:
+            self.init_if_needed()
 
     ###########
     # Methods to override to customize your component
@@ -344,6 +917,27 @@ class Component(FrameworkBaseMixin):
         """
         pass
 
+    def get_etag(self):
+        """
+            Return a string that changes whenever this component's render
+            would (eg. a version or the updated time of what it shows) to
+            let GET requests for it be answered with `304 Not Modified`
+            without running `init`, `final` or rendering it. It must also
+            change whenever the renders of its child components would.
+
+            It's called after the guards but before `init`, so keep it
+            cheap. Returning None (the default) means the component can't
+            tell, and disables `304`s for the responses it's part of.
+        """
+        return None
+
+    def get_last_modified(self):
+        """
+            Like `get_etag`, but return the datetime this component's render
+            last changed.
+        """
+        return None
+
     def login_redirect_next_url(self, include_get=False):
         """
         After logging in, what is the URL the user should be forwarded
@@ -409,6 +1003,8 @@ class Component(FrameworkBaseMixin):
                                  "This prevents infinite loops.")
         else:
             self.dependent_component_classes.append(DependentComponentClass)
+            # Its content changed, so the cached renders are stale too
+            self.invalidate_cache_tags(*DependentComponentClass.get_cache_tags(self.kwargs))
 
     def add_child_component(self, ChildComponentClass, kwargs=None, obj_cache_init=None):
         """
@@ -436,6 +1032,15 @@ class Component(FrameworkBaseMixin):
                 self._form_init_cached['param_key'] = self.param_key
         return self._form_init_cached
 
+    def invalidate_cache_tags(self, *tags):
+        """
+            Invalidates the cached renders of all components with any of the
+            given `cache_tags` (already formatted). Call this from a
+            `handler` that changes data that cached components show.
+        """
+        if tags:
+            invalidate_tags(*tags)
+
     def set_message(self, message_type, message_text=''):
         self.response_message['message_type'] = message_type
         self.response_message['message_text'] = message_text
@@ -460,6 +1065,11 @@ class Component(FrameworkBaseMixin):
     def get_component_key(cls):
         return COMPONENT_KEYS['from_component_class'][cls]
 
+    @classmethod
+    def get_cache_tags(cls, kwargs):
+        kwargs = kwargs or {}
+        return [tag % kwargs for tag in cls.cache_tags]
+
     # Guards that can be used in other guards
 
     def guard_active_user(self, include_get=False):
@@ -508,12 +1118,57 @@ class Component(FrameworkBaseMixin):
         # bool to make it safe to return None
         return bool(self.is_deferred())
 
+    def uses_fragment_cache(self):
+        # POSTs and renders showing a response message are never cached
+        return (self.cache_timeout is not None
+                and not self.is_post()
+                and not self.response_message)
+
+    def load_cached_render(self):
+        """
+        Looks up the cached render of this component (see `cache_timeout`).
+        Returns True on a hit, in which case the rest of the component's
+        lifecycle is skipped.
+        """
+        if not self.uses_fragment_cache():
+            return False
+        # Deferred placeholders in the render carry the request's query
+        # string (see get_defer_request_info)
+        self.fragment_cache_key = get_fragment_cache_key(
+            self, get_defer_request_info(self.request_info))
+        if not self.refresh_fragment_cache:
+            self.cached_render = get_component_cache().get(self.fragment_cache_key)
+        return self.cached_render is not None
+
+    def get_guard_key(self):
+        """
+        The key `guard` results are memoized with, or None to not memoize
+        them (see memoize_guard).
+        """
+        if not self.memoize_guard or self.dependent:
+            return None
+        return get_memo_key(self.__class__, self.param_key, self.kwargs or {},
+                            self.request_info.page_key, self.request_info.passive,
+                            self.request_info.method, getattr(self.user, 'pk', None))
+
     def run_guards(self):
-        self.guard_fail = self.guard()
+        guard_key = self.get_guard_key()
+        if guard_key is not None and guard_key in self.obj_cache.guard_results:
+            guard_fail, guarded_classes = self.obj_cache.guard_results[guard_key]
+            self.guard_fail = guard_fail
+            self.guarded_dependent_component_classes = list(guarded_classes)
+            return
 
-        for ComponentClass in self.guarded_dependent_component_classes:
-            component = ComponentClass(self.dependent_request_info, self.obj_cache, guard_only=True)
-            self.check_guard(component)
+        with self.component_profile_phase('guard'):
+            self.guard_fail = self.guard()
+
+            for ComponentClass in self.guarded_dependent_component_classes:
+                component = ComponentClass(self.dependent_request_info, self.obj_cache, guard_only=True)
+                self.check_guard(component)
+
+        if guard_key is not None:
+            self.obj_cache.guard_results[guard_key] = (
+                self.guard_fail, tuple(self.guarded_dependent_component_classes))
 
     def get_response_action_tuple(self, request):
         return ((self.param_key or self.component_key), self.response_action_dict(request))
@@ -546,48 +1201,154 @@ class Component(FrameworkBaseMixin):
         the deferred template message.
         """
         return {
-            'url': lambda: fuzzy_reverse(self.component_key, kwargs=self.kwargs),
-            'page_url': lambda: fuzzy_reverse(self.request_info.page_key, kwargs=self.kwargs),
+            'url': self.get_url,
+            'page_url': self.get_page_url,
             'component_key': self.component_key,
             'param_key': self.param_key,
             'page_key': self.request_info.page_key,
+            'defer_priority': self.defer_priority,
+            'defer_prefetch': self.defer_prefetch,
         }
 
+    def get_url(self):
+        """
+        The url of this component (with its kwargs), reversed once per
+        component.
+        """
+        if self._url is None:
+            self._url = fuzzy_reverse(self.component_key, kwargs=self.kwargs)
+        return self._url
+
+    def get_page_url(self):
+        if self._page_url is None:
+            self._page_url = fuzzy_reverse(self.request_info.page_key, kwargs=self.kwargs)
+        return self._page_url
+
     def render_debug_extra(self):
         return mark_safe("""<div class="debug_component_info" style="display:none">
                                 component_key: %s; template_name: %s
                             </div>""" % (self.component_key, self.template_name))
 
+    def render_profile_extra(self):
+        """
+        The timings of the phases this component ran before rendering, when
+        the request is being profiled.
+        """
+        node = getattr(self, '_profile_node', None)
+        if node is None:
+            return mark_safe('')
+        timings = "; ".join("%s: %.2fms (%s queries)" % (phase, totals['wall'] * 1000,
+                                                         totals['queries'])
+                            for phase, totals in sorted(node.phases.items()))
+        return mark_safe("""<div class="debug_component_info debug_component_profile" style="display:none">
+                                %s
+                            </div>""" % escape(timings))
+
+    def get_profile_label(self):
+        if self.param_key:
+            return "%s[%s]" % (self.component_key, self.param_key)
+        return self.component_key
+
     def render(self, request, is_child=False):
+        with self.component_profile_phase('render'):
+            return self._render_output(request, is_child)
+
+    def _render_output(self, request, is_child):
+        if self.stream_pending:
+            # The real render will be streamed in later
+            return self._render_stream_placeholder()
+
         if self.blank:
             render_output = self._render_blank(request)
         elif self.defer_this_request(request, is_child):
             render_output = self._render_deferred(request)
+            if self.prefetch_on_server:
+                self.obj_cache.prefetch_components.append(self)
+                # The placeholder carries this page load's nonce
+                self.render_uncacheable = True
+        elif self.cached_render is not None:
+            render_output = mark_safe(self.cached_render)
         else:
             render_output = self._render(request)
+            if self.fragment_cache_key and not self.render_uncacheable:
+                get_component_cache().set(self.fragment_cache_key, render_output,
+                                          self.cache_timeout)
         if getattr(settings, 'DEBUG', False) and getattr(settings, 'COMPONENT_DEBUG_INFO', True):
-            render_output = self.render_debug_extra() + render_output
+            render_output = (self.render_debug_extra() + self.render_profile_extra()
+                             + render_output)
         return render_output
 
     def _render(self, request):
         context = RequestContext(request, self._get_context(request))
+        csrf_token = context.get('csrf_token')
+        if csrf_token is not None:
+            context['csrf_token'] = lazy(self._read_csrf_token, str)(csrf_token)
         return render_to_string(self.template_name, context_instance=context)
 
+    def _read_csrf_token(self, csrf_token):
+        # The token is per session, so a render using it can't be cached
+        self.render_uncacheable = True
+        return str(csrf_token)
+
     def _render_deferred(self, request):
-        uastr = request.META.get('HTTP_USER_AGENT', '').lower()
-        # don't show the no-js warning to search bots -- they see it 5 times
-        # on a page and think it's important
-        bots = (
-            'googlebot', 'mediapartners', 'adsbot', # google
-            'bingbot', 'adidxbot', 'msnbot', 'bingpreview', # bing, yahoo
-        )
-        search_bot = any(bot in uastr for bot in bots)
-        context = Context({
-            'component_info': self._get_component_info(),
-            'get_params': request.META.get('QUERY_STRING', '').replace('force_full_page=true', '_=_'),
-            'search_bot': search_bot,
+        search_bot, get_params = get_defer_request_info(request)
+        if self.prefetch_on_server:
+            # Ties the deferred request to the render prefetched for this page load
+            get_params = u'%s%s=%s' % (get_params + u'&' if get_params else u'',
+                                      PREFETCH_PARAM, self.obj_cache.get_prefetch_nonce())
+        defer_template_name = (self.defer_template_name
+                               or getattr(settings, 'COMPONENT_DEFER_TEMPLATE', None))
+        if not defer_template_name and not is_framework_template(DEFER_TEMPLATE):
+            # The project overrides the default template
+            defer_template_name = DEFER_TEMPLATE
+        if defer_template_name:
+            context = Context({
+                'component_info': self._get_component_info(),
+                'get_params': get_params,
+                'search_bot': search_bot,
+            })
+            return render_to_string(defer_template_name, context_instance=context)
+
+        # The framework's own includes/defer_loading.html, without going
+        # through the template engine.
+        if self.param_key:
+            param_key_attr = u'data-cmp_param_key="%s"' % escape(self.param_key)
+        else:
+            param_key_attr = u''
+        if search_bot:
+            no_js = u''
+        else:
+            no_js = DEFER_NO_JS_HTML % {'page_url': escape(self.get_page_url())}
+        return mark_safe(DEFER_LOADING_HTML % {
+            'url': escape(self.get_url()),
+            'get_params': escape(get_params),
+            'page_key': escape(self.request_info.page_key or ''),
+            'component_key': escape(self.component_key),
+            'param_key_attr': param_key_attr,
+            'priority': int(self.defer_priority),
+            'prefetch_attr': u' data-cmp_prefetch="true"' if self.defer_prefetch else u'',
+            'no_js': no_js,
+        })
+
+    def get_stream_id(self):
+        return "cmp_stream_%s" % (self.param_key or self.component_key)
+
+    def _render_stream_placeholder(self):
+        return render_to_string('includes/stream_placeholder.html', {
+            'stream_id': self.get_stream_id(),
+            'component_key': self.component_key,
+        })
+
+    def render_stream_chunk(self, request):
+        """
+            Renders the chunk that replaces this component's stream
+            placeholder once the page has been sent.
+        """
+        return render_to_string('includes/stream_chunk.html', {
+            'stream_id': self.get_stream_id(),
+            'component_key': self.component_key,
+            'render_output': self.render(request),
         })
-        return render_to_string('includes/defer_loading.html', context_instance=context)
 
     def _render_blank(self, request):
         """Render blank (or show debug info) if a component
@@ -608,10 +1369,80 @@ class Component(FrameworkBaseMixin):
         for child in self.child_components:
             key = child.param_key or child.component_key
             child_renders.append((key, child.render(request, is_child=True)))
+            if child.render_uncacheable:
+                self.render_uncacheable = True
         return child_renders
 
+    def promote(self):
+        """
+        Initializes a component that was constructed with guard_only=True,
+        once its guards (and its Page's) have passed, rather than
+        constructing it again.
+        """
+        if not self.guard_only:
+            raise ComponentError("Only guard_only components can be promoted")
+        self.guard_only = False
+        self.init_if_needed()
+        return self
+
+    def init_if_needed(self):
+        if not self.guard_fail and not self.defer_this_request(self.request_info):
+            self.run_init()
+
+    def get_prefetch_cache_key(self):
+        session_key = getattr(self.request_info.session, 'session_key', None)
+        nonce = self.request_info.GET.get(PREFETCH_PARAM)
+        if not session_key or not nonce:
+            return None
+        return get_prefetch_cache_key(session_key, nonce, self.component_key, self.param_key,
+                                      self.kwargs)
+
+    def get_url_kwargs(self):
+        """
+        The kwargs of this component's own url (see `get_url`), which are
+        the kwargs its deferred request gets.
+        """
+        path = self.get_url()
+        prefix = get_script_prefix()
+        if path.startswith(prefix):
+            path = '/' + path[len(prefix):]
+        return resolve(path).kwargs
+
+    def load_prefetched_render(self):
+        """
+        Uses (once) the render prefetched for this component (see
+        `prefetch_on_server`) instead of initializing it. The guards must
+        have run already. Returns True if there was one.
+        """
+        cache_key = self.get_prefetch_cache_key()
+        if cache_key is None:
+            return False
+        cache = get_component_cache()
+        prefetched = cache.get(cache_key)
+        if prefetched is None:
+            return False
+        cache.delete(cache_key)
+        self.guard_only = False
+        self.cached_render = prefetched
+        return True
+
+    def run_init(self):
+        if not self.load_cached_render():
+            with self.component_profile_phase('init'):
+                self.init()
+
     def run_handler(self, request):
-        return self.handler(request)
+        with self.component_profile_phase('handler'):
+            try:
+                return self.handler(request)
+            finally:
+                # The handler may change what the guards depend on
+                self.obj_cache.guard_results.clear()
+
+    def run_final(self):
+        if self.cached_render is None:
+            with self.component_profile_phase('final'):
+                self.final()
 
     def defer_this_request(self, request, is_child=False):
         if not self.component_is_deferred:
@@ -636,6 +1467,35 @@ class Component(FrameworkBaseMixin):
         The idea is that this function may be called from Page or
         ComponentView to recursively elaborate all child components
         """
+        if self.cached_render is not None:
+            # The cached render already includes the children
+            return
+
+        with self.component_profile_phase('init_child_components'):
+            pool = get_pool('COMPONENT_CHILD_POOL_SIZE')
+            if pool is not None and not in_worker_thread(pool):
+                self._init_child_components_by_level(request_info, pool)
+                return
+
+            children = [(self._construct_child(*spec), spec[1])
+                        for spec in self._get_child_specs(request_info)]
+            prime_child_components(children, self.obj_cache)
+
+            for component, child_request_info in children:
+                if component.guard_fail:
+                    component.blank = True
+                elif not component.defer_this_request(child_request_info, is_child=True):
+                    component.run_final()
+                    component.init_child_components(child_request_info)
+
+                self.child_components.append(component)
+
+    def _get_child_specs(self, request_info):
+        """
+        (ComponentClass, request_info, param_key) for each child component
+        added with `add_child_component`, in order.
+        """
+        specs = []
         for ComponentClass, kwargs in self.child_component_classes:
             component_key = ComponentClass.get_component_key()
 
@@ -646,18 +1506,56 @@ class Component(FrameworkBaseMixin):
                 param_key = None
 
             # We don't want to accidently post to one of the children here.
-            request_info = StrippedRequestInfo(request_info, request_info.page_key,
-                                               kwargs, passive=True)
+            child_request_info = StrippedRequestInfo(request_info, request_info.page_key,
+                                                     kwargs, passive=True)
+            specs.append((ComponentClass, child_request_info, param_key))
+        return specs
 
-            component = ComponentClass(request_info, self.obj_cache, param_key=param_key)
+    def _construct_child(self, ComponentClass, child_request_info, param_key):
+        return ComponentClass(child_request_info, self.obj_cache, param_key=param_key)
 
-            if component.guard_fail:
-                component.blank = True
-            elif not component.defer_this_request(request_info, is_child=True):
-                component.final()
-                component.init_child_components(request_info)
+    def _construct_child_in_pool(self, ComponentClass, child_request_info, param_key):
+        # Profiled under this component rather than the one that started
+        # the elaboration
+        with self.component_profile_phase('init_child_components'):
+            return self._construct_child(ComponentClass, child_request_info, param_key)
 
-            self.child_components.append(component)
+    def _init_child_components_by_level(self, request_info, pool):
+        """
+        Elaborates the tree of child components one level at a time rather
+        than depth first (COMPONENT_CHILD_POOL_SIZE): the children of every
+        component in a level are constructed (running their guards and
+        `init`) concurrently, the batch_obj_cache values of the whole level
+        are loaded, and then their `final`s run concurrently. Each
+        component's `child_components` keep the order they were added in.
+        """
+        level = [(self, request_info)]
+        while level:
+            parents = []
+            constructors = []
+            for parent, parent_request_info in level:
+                construct = (parent._construct_child if parent is self
+                             else parent._construct_child_in_pool)
+                for spec in parent._get_child_specs(parent_request_info):
+                    parents.append(parent)
+                    constructors.append(partial(construct, *spec))
+
+            children = [(component, component.request_info)
+                        for component in run_all(pool, constructors)]
+            prime_child_components(children, self.obj_cache)
+
+            level = []
+            for parent, (component, child_request_info) in zip(parents, children):
+                if component.guard_fail:
+                    component.blank = True
+                elif not component.defer_this_request(child_request_info, is_child=True):
+                    level.append((component, child_request_info))
+                parent.child_components.append(component)
+
+            run_all(pool, [component.run_final for component, child_request_info in level])
+            # Cached renders already include their children
+            level = [(component, child_request_info) for component, child_request_info in level
+                     if component.cached_render is None]
 
     def init_dependent_components(self, request):
         """
@@ -666,12 +1564,24 @@ class Component(FrameworkBaseMixin):
         the handler has done any relevant updates on data in obj_cache.
         """
         if should_load_partial_page(request):
-            for ComponentClass in self.dependent_component_classes:
-                new_component = ComponentClass(self.dependent_request_info, self.obj_cache)
-
-                new_component.final()
-                new_component.init_child_components(self.request_info)
-                self.dependent_components.append(new_component)
+            # Concurrently with COMPONENT_DEPENDENT_POOL_SIZE set, but kept in
+            # order. Only opt-in: pool threads have their own DB connections,
+            # so they don't see the handler's uncommitted writes.
+            with self.component_profile_phase('init_dependent_components'):
+                self.dependent_components.extend(run_all(
+                    get_pool('COMPONENT_DEPENDENT_POOL_SIZE'),
+                    [partial(self._init_dependent_component, ComponentClass)
+                     for ComponentClass in self.dependent_component_classes]))
+
+    def _init_dependent_component(self, ComponentClass):
+        # Dependents are re-rendered because their content changed,
+        # so never use a cached render, but do cache the new one.
+        new_component = ComponentClass(self.dependent_request_info, self.obj_cache,
+                                       refresh_fragment_cache=True, dependent=True)
+
+        new_component.run_final()
+        new_component.init_child_components(self.request_info)
+        return new_component
 
     @classmethod
     def has_guard(cls):
@@ -753,6 +1663,11 @@ class Page(FrameworkBaseMixin):
 
     template_name = None
 
+    # Set to True to send the page as soon as all components but the
+    # `streamed` ones are rendered, and to stream those in afterwards.
+    # Only applies to full page, non-ajax GET requests.
+    streaming = False
+
     def __init__(self, obj_cache, component=None, request_info=None,
                  response_message=None, guard_only=False, **kwargs):
         # The else can probably never happen anymore; get_page always
@@ -781,15 +1696,18 @@ class Page(FrameworkBaseMixin):
         self.guard_only = guard_only
         self.guard_done = False
 
-        self.set_components_full(requested_component=component)
+        # Guard only Pages track the worst guard failure as components are
+        # added, see `add_component`
+        self.guard_fail = None
+
+        self.stream = self.should_stream()
+
+        with self.component_profile_phase('set_components'):
+            self.set_components_full(requested_component=component)
 
         self.run_guards()
         if not self.guard_only:
-            if self.guard_fail:
-                raise ComponentError("By the time non-guard_only Page comes around, "
-                                     "Page should have passed all guards.")
-            self.guard_done = True
-            self.init()
+            self.init_page()
 
         self.components_render_dict = ComponentsRenderDict()
 
@@ -810,6 +1728,17 @@ class Page(FrameworkBaseMixin):
         """
         pass
 
+    def get_etag(self):
+        """
+            Like Component.get_etag, for the content of the Page itself.
+            Unlike Components, the Page's content is assumed not to change
+            between deploys (see COMPONENT_ETAG_VERSION) if this returns None.
+        """
+        return None
+
+    def get_last_modified(self):
+        return None
+
     def get_page_context(self):
         """
             Add variables to the template context.
@@ -821,6 +1750,41 @@ class Page(FrameworkBaseMixin):
     # Methods to call from your `Page` class methods:
     ##########
 
+    def promote(self, recheck_guards=False):
+        """
+        Turns a guard_only Page whose guards passed into a full Page by
+        promoting the components it already constructed (see
+        `Component.promote`) instead of constructing them again. The
+        requested component is left to its view to promote.
+
+        With `recheck_guards` (when a handler has run since the guards did,
+        and may have changed what they check) the added components run
+        their guards again first.
+        """
+        if not self.guard_only:
+            raise ComponentError("Only guard_only Pages can be promoted")
+        if recheck_guards:
+            for lookup_key in self.added_component_keys:
+                self.components[lookup_key].run_guards()
+            self.run_guards()
+        self.guard_only = False
+        self.stream = self.should_stream()
+        self.init_pool = get_pool('COMPONENT_INIT_POOL_SIZE')
+        self.scheduled_components = []
+
+        for lookup_key in self.added_component_keys:
+            component = self.components[lookup_key]
+            promote_component = partial(self._promote_component, component)
+            if self.init_pool is not None:
+                self.scheduled_components.append((lookup_key, component.__class__,
+                                                  promote_component))
+            else:
+                promote_component()
+        self.run_scheduled_components()
+
+        self.init_page()
+        return self
+
     def add_component(self, NewComponentClass, kwargs=None):
         """
         This takes a component class, initializes it, and adds the
@@ -835,14 +1799,19 @@ class Page(FrameworkBaseMixin):
         if NewComponentClass not in COMPONENT_KEYS['from_component_class']:
             raise ComponentError("%s not registered (via urls.py)" % NewComponentClass.__name__)
 
+        if self.guard_only and self.guard_fail and self.guard_fail['always_redirect']:
+            # No other component's guard failure could replace this one (see
+            # `check_guard`), so don't bother building the rest.
+            return
+
         new_component_key = COMPONENT_KEYS['from_component_class'][NewComponentClass]
 
         if kwargs is not None:
-            lookup_key = md5(reverse(new_component_key, kwargs=kwargs)).hexdigest()
+            lookup_key = self.get_param_key(new_component_key, kwargs)
         else:
             lookup_key = new_component_key
 
-        if lookup_key in self.components:
+        if lookup_key in self.component_classes:
             return
 
         if self.response_message.get('component_key') == new_component_key:
@@ -860,17 +1829,20 @@ class Page(FrameworkBaseMixin):
             param_key = None
             request_info = self.new_component_request_info
 
-        new_component = NewComponentClass(
-            request_info, self.obj_cache,
-            response_message=component_response_message,
-            guard_only=self.guard_only, param_key=param_key)
+        init_component = partial(self._init_component, NewComponentClass, request_info,
+                                 component_response_message, param_key)
 
-        if not self.guard_only and not new_component.defer_this_request(self.request_info):
-            new_component.final()
-            new_component.init_child_components(self.request_info)
+        self.added_component_keys.append(lookup_key)
+        if self.init_pool is not None:
+            # Initialized concurrently once set_components is done
+            self.scheduled_components.append((lookup_key, NewComponentClass, init_component))
+            self.component_classes[lookup_key] = NewComponentClass
+            return
 
-        self.components[lookup_key] = new_component
+        self.components[lookup_key] = init_component()
         self.component_classes[lookup_key] = NewComponentClass
+        if self.guard_only:
+            self.check_guard(self.components[lookup_key])
 
     def this_url(self):
         return self.page_reverse(kwargs=self.kwargs)
@@ -892,25 +1864,156 @@ class Page(FrameworkBaseMixin):
             This is not designed for overriding.
         """
 
-        self.components = {}
+        self.components = PageComponentsDict(self)
         self.component_classes = {}
+        # Keys of the components constructed by add_component, in order
+        self.added_component_keys = []
         if requested_component:
             self.components[requested_component.component_key] = requested_component
             self.component_classes[requested_component.component_key] = requested_component.__class__
 
+        # Guard only Pages only construct components to run their guards,
+        # so there is nothing worth running concurrently.
+        self.init_pool = None if self.guard_only else get_pool('COMPONENT_INIT_POOL_SIZE')
+        self.scheduled_components = []
+
         self.set_components()
 
         # always add the page's primary component by default, if it hasn't been added
         primary_component_class = COMPONENT_KEYS['to_component_class'][self.page_key]
         self.add_component(primary_component_class)
 
+        self.run_scheduled_components()
+
+    def _init_component(self, NewComponentClass, request_info, response_message, param_key):
+        # Streamed components only run their guards for now, see
+        # `iter_streamed_components`
+        stream = self.stream and NewComponentClass.streamed
+        new_component = NewComponentClass(
+            request_info, self.obj_cache,
+            response_message=response_message,
+            guard_only=self.guard_only or stream, param_key=param_key)
+
+        if not self.guard_only:
+            self._finish_component(new_component, stream)
+        return new_component
+
+    def _promote_component(self, component):
+        stream = self.stream and component.streamed
+        if not stream:
+            component.promote()
+        self._finish_component(component, stream)
+        return component
+
+    def _finish_component(self, component, stream):
+        if not component.defer_this_request(self.request_info):
+            if stream:
+                component.stream_pending = True
+            else:
+                component.run_final()
+                component.init_child_components(self.request_info)
+
+    def should_stream(self):
+        return (self.streaming
+                and not self.guard_only
+                and self.request_info.method == 'GET'
+                and not self.request_info.is_ajax()
+                # Before Django 1.5, CommonMiddleware reads the whole
+                # response to work out its ETag
+                and (STREAMING_RESPONSES or not getattr(settings, 'USE_ETAGS', False)))
+
+    def init_page(self):
+        if self.guard_fail:
+            raise ComponentError("By the time non-guard_only Page comes around, "
+                                 "Page should have passed all guards.")
+        self.guard_done = True
+        with self.component_profile_phase('init'):
+            self.init()
+
+    def get_profile_label(self):
+        return "page:%s" % self.page_key
+
+    def has_streamed_components(self):
+        return any(component.stream_pending for component in self.components.itervalues())
+
+    def _finish_streamed_component(self, component, request):
+        component.stream_pending = False
+        component.promote()
+        component.run_final()
+        component.init_child_components(self.request_info)
+        return component.render_stream_chunk(request)
+
+    def iter_streamed_components(self, request):
+        """
+            Initializes and renders the streamed components, yielding their
+            chunks as they finish (concurrently with COMPONENT_INIT_POOL_SIZE
+            set). This runs after the response has started, so failures are
+            logged and leave the placeholder in place.
+        """
+        streamed = sorted((component for component in self.components.itervalues()
+                           if component.stream_pending),
+                          key=lambda component: -component.defer_priority)
+        finished = run_unordered(get_pool('COMPONENT_INIT_POOL_SIZE'),
+                                 [partial(self._finish_streamed_component, component, request)
+                                  for component in streamed])
+        for index, succeeded, value in finished:
+            if succeeded:
+                yield value
+            else:
+                logger.error("Failed streaming component %s", streamed[index].component_key,
+                             exc_info=value)
+
+    def is_scheduled(self, lookup_key):
+        return any(job[0] == lookup_key for job in self.scheduled_components)
+
+    def run_scheduled_components(self):
+        """
+            Initializes the components scheduled by `add_component` when
+            COMPONENT_INIT_POOL_SIZE is set.
+
+            Components are initialized in waves: each wave contains every
+            scheduled component whose `init_after` classes (that are also
+            scheduled on this page) have finished, and the components in a
+            wave run their construction (guards and `init`), `final` and
+            `init_child_components` concurrently.
+        """
+        pending = self.scheduled_components
+        self.scheduled_components = []
+        scheduled_classes = set(ComponentClass for _, ComponentClass, _ in pending)
+        done_classes = set()
+        initialized = {}
+
+        while pending:
+            wave = [job for job in pending
+                    if not (set(job[1].init_after) & scheduled_classes) - done_classes]
+            if not wave:
+                raise ComponentError(
+                    "Circular init_after dependencies between: %s"
+                    % ", ".join(job[1].__name__ for job in pending))
+
+            components = run_all(self.init_pool, [job[2] for job in wave])
+            for (lookup_key, ComponentClass, _), component in zip(wave, components):
+                initialized[lookup_key] = component
+            # Only mark classes as done once every instance of them is done
+            pending = [job for job in pending if job[0] not in initialized]
+            done_classes = scheduled_classes - set(job[1] for job in pending)
+
+        self.components.update(initialized)
+
     def _get_context(self, request):
         final_context = self.ctx
         final_context.update(self.get_page_context())
         final_context['components'] = self.components_render_dict
         final_context['has_component'] = dict.fromkeys(self.components.keys(), True)
-        for key, component in self.components.items():
-            final_context['components'][key] = component.render(request)
+
+        # With COMPONENT_RENDER_POOL_SIZE set, the (already initialized)
+        # components are rendered concurrently, but the results are still
+        # added in the same order and the first failure is re-raised.
+        items = self.components.items()
+        renders = run_all(get_pool('COMPONENT_RENDER_POOL_SIZE'),
+                          [partial(component.render, request) for key, component in items])
+        for (key, component), render_output in zip(items, renders):
+            final_context['components'][key] = render_output
         final_context['request_info'] = self.request_info
         return final_context
 
@@ -1021,6 +2124,48 @@ class ComponentView(FrameworkBaseMixin, View):
         self.component_key = initkwargs['component_key']
         self.ComponentClass = initkwargs['ComponentClass']
 
+    def dispatch(self, request, *args, **kwargs):
+        self.profiler = ComponentProfiler() if profiling_enabled() else None
+        response = super(ComponentView, self).dispatch(request, *args, **kwargs)
+        if self.profiler is not None:
+            obj_cache = getattr(self, 'obj_cache', None)
+            if obj_cache is not None:
+                self.profiler.obj_cache_stats = obj_cache.stats
+            self.profiler.finish(request, response)
+        self._schedule_prefetch(request, response)
+        return response
+
+    def _schedule_prefetch(self, request, response):
+        """
+        Prefetches the deferred components rendered in this response (see
+        Component.prefetch_on_server) once the response has been sent.
+        """
+        obj_cache = getattr(self, 'obj_cache', None)
+        if obj_cache is None or not obj_cache.prefetch_components or response.status_code != 200:
+            return
+        pool = get_pool('COMPONENT_PREFETCH_POOL_SIZE')
+        if pool is None:
+            return
+
+        specs = []
+        for component in obj_cache.prefetch_components:
+            # Prefetched with the kwargs its deferred request will have
+            if component.param_key:
+                kwargs = component.kwargs
+            else:
+                kwargs = component.get_url_kwargs()
+            spec = (component.__class__, kwargs, component.param_key,
+                    component.request_info.page_key)
+            if spec not in specs:
+                specs.append(spec)
+        nonce = obj_cache.get_prefetch_nonce()
+
+        close = response.close
+        def close_and_prefetch():
+            close()
+            run_in_background(pool, partial(prefetch_deferred_components, request, specs, nonce))
+        response.close = close_and_prefetch
+
     def _get_component(self, request, kwargs):
         """
         This instantiates the attached component class object, runs guards, and
@@ -1037,25 +2182,110 @@ class ComponentView(FrameworkBaseMixin, View):
             response_message = {}
 
         if should_load_partial_page(request):
+            # GET requests may not need more than the guards to run: the
+            # response could be a 304 or a prefetched render.
+            passive_get = request.method in ('GET', 'HEAD')
             component = self.ComponentClass(request_info, self.obj_cache,
                                             response_message=response_message,
-                                            param_key=request.REQUEST.get('param_key'))
+                                            param_key=request.REQUEST.get('param_key'),
+                                            guard_only=passive_get)
+            if passive_get and not component.guard_fail:
+                if self.is_not_modified(request, [component]):
+                    return component, None
+                prefetched = (component.prefetch_on_server
+                              and request.GET.get('deferred') == 'true'
+                              and component.load_prefetched_render())
+                if not prefetched:
+                    component.promote()
             return component, component.guard_fail
         else:
-            guard_component = self.ComponentClass(
+            component = self.ComponentClass(
                 request_info, self.obj_cache, response_message=response_message,
                 guard_only=True)
-            if not getattr(guard_component, 'bypass_page_guard', False):
+            if not getattr(component, 'bypass_page_guard', False):
                 guard_page = get_page(
-                    self.request, self.obj_cache, component=guard_component,
+                    self.request, self.obj_cache, component=component,
                     response_message=self.response_message, guard_only=True)
                 if guard_page.guard_fail:
                     return None, guard_page.guard_fail
+                # promoted if the full page gets rendered
+                self.guard_page = guard_page
 
-            # Get an initialized component
-            component = self.ComponentClass(request_info, self.obj_cache,
-                                            response_message=response_message)
-            return component, component.guard_fail
+            if component.guard_fail:
+                return component, component.guard_fail
+
+            # Without the guard page (bypass_page_guard) the Page's other
+            # Components aren't known yet, so there are no validators
+            if request.method in ('GET', 'HEAD') and self.guard_page is not None:
+                page_components = [component] + [
+                    page_component for page_component in self.guard_page.components.values()
+                    if page_component is not component]
+                if self.is_not_modified(request, page_components, self.guard_page):
+                    return component, None
+            return component.promote(), None
+
+    def is_not_modified(self, request, components, page=None):
+        """
+        Works out the validators (ETag and Last-Modified) of a response made
+        of `components` (and `page`), from their `get_etag` and
+        `get_last_modified`, and returns True if the request's conditional
+        headers say the client already has it.
+
+        Components that will be deferred in this request don't count, since
+        only their placeholder is part of the response. Responses with a
+        response message or pending messages never validate.
+        """
+        self.etag = self.last_modified = None
+        self.not_modified = False
+        if self.response_message:
+            return False
+
+        components = [component for component in components
+                      if not component.defer_this_request(request)]
+        etags = [component.get_etag() for component in components]
+        page_etag = page.get_etag() if page is not None else None
+        if None not in etags and (etags or page_etag is not None):
+            parts = [getattr(settings, 'COMPONENT_ETAG_VERSION', ''),
+                     page_etag,
+                     should_load_partial_page(request),
+                     translation.get_language(),
+                     getattr(request.user, 'pk', None)]
+            parts += sorted((component.param_key or component.component_key, etag)
+                            for component, etag in zip(components, etags))
+            self.etag = md5(repr(parts)).hexdigest()
+
+        last_modified = [component.get_last_modified() for component in components]
+        if page is not None and page.get_last_modified() is not None:
+            last_modified.append(page.get_last_modified())
+        if last_modified and None not in last_modified:
+            self.last_modified = timegm(max(last_modified).utctimetuple())
+
+        if self.etag is None and self.last_modified is None:
+            return False
+        # Checked last, as it loads the message storage (usually the session)
+        if len(messages.get_messages(request)):
+            self.etag = self.last_modified = None
+            return False
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_none_match is not None:
+            # If-None-Match wins over If-Modified-Since
+            if self.etag is not None:
+                client_etags = parse_etags(if_none_match)
+                self.not_modified = self.etag in client_etags or '*' in client_etags
+        elif if_modified_since is not None and self.last_modified is not None:
+            since = parse_http_date_safe(if_modified_since)
+            self.not_modified = since is not None and self.last_modified <= since
+        return self.not_modified
+
+    def _add_validator_headers(self, response):
+        if response.status_code in (200, 304):
+            if self.etag is not None and not response.has_header('ETag'):
+                response['ETag'] = quote_etag(self.etag)
+            if self.last_modified is not None and not response.has_header('Last-Modified'):
+                response['Last-Modified'] = http_date(self.last_modified)
+        return response
 
     def sanity_check(self, request):
         """
@@ -1075,6 +2305,11 @@ class ComponentView(FrameworkBaseMixin, View):
             return HttpResponseBadRequest()
 
         self.obj_cache = ObjectCache(init=self.init_obj_cache)
+        self.obj_cache.profiler = self.profiler
+        self.guard_page = None
+        # See is_not_modified
+        self.etag = self.last_modified = None
+        self.not_modified = False
         self.page_key = get_page_key(request, self.ComponentClass)
         if self.page_key is None:
             return HttpResponseNotFound(render_to_string('404.html'))
@@ -1112,7 +2347,7 @@ class ComponentView(FrameworkBaseMixin, View):
 
         # Run the handler. Get a response, if any.
         handler_result = self.component.run_handler(request)
-        self.component.final()
+        self.component.run_final()
         passive_ri = StrippedRequestInfo(request, self.page_key, kwargs, passive=True)
         self.component.init_child_components(passive_ri)
         self.component.init_dependent_components(request)
@@ -1125,12 +2360,15 @@ class ComponentView(FrameworkBaseMixin, View):
         if ret is not None:
             return ret
 
+        if self.not_modified:
+            return self._add_validator_headers(HttpResponseNotModified())
+
         if not self.component.defer_this_request(request):
-            self.component.final()
+            self.component.run_final()
         passive_ri = StrippedRequestInfo(request, self.page_key, kwargs, passive=True)
         self.component.init_child_components(passive_ri)
 
-        return self._get_http_response(None, kwargs)
+        return self._add_validator_headers(self._get_http_response(None, kwargs))
 
     def _get_http_response(self, handler_result, component_kwargs):
         # Handle ajax vs non-ajax requests
@@ -1177,16 +2415,63 @@ class ComponentView(FrameworkBaseMixin, View):
                     fuzzy_reverse(self.page_key, kwargs=component_kwargs) + get_string))
             else:
                 # Show full page when not directed otherwise.
-                page = get_page(self.request,
-                                self.obj_cache,
-                                component=self.component,
-                                response_message=self.response_message)
-                page_render = render(self.request,
-                                     page.template_name,
-                                     page._get_context(self.request))
+                if self.guard_page is not None:
+                    # The guards ran before the handler of a POST
+                    page = self.guard_page.promote(
+                        recheck_guards=self.request.method == 'POST')
+                else:
+                    page = get_page(self.request,
+                                    self.obj_cache,
+                                    component=self.component,
+                                    response_message=self.response_message)
+                if page.has_streamed_components():
+                    return self._add_response_headers(self._get_streaming_response(page))
+                with page.component_profile_phase('render'):
+                    page_render = render(self.request,
+                                         page.template_name,
+                                         page._get_context(self.request))
                 page.handle_component_key_errors()
                 return self._add_response_headers(page_render)
 
+    def _get_streaming_response(self, page):
+        """
+        Sends the page with placeholders for its streamed components, then
+        their renders as they finish, and then the end of the page (from
+        its `</body>` on).
+        """
+        page_render = render_to_string(
+            page.template_name, page._get_context(self.request),
+            context_instance=RequestContext(self.request))
+        page.handle_component_key_errors()
+
+        body_end = page_render.lower().rfind('</body>')
+        if body_end == -1:
+            body_end = len(page_render)
+        page_start, page_end = page_render[:body_end], page_render[body_end:]
+
+        # Middleware may deactivate the language before the response is
+        # iterated.
+        language = translation.get_language()
+        request = self.request
+
+        def content():
+            yield page_start
+            translation.activate(language)
+            try:
+                for chunk in page.iter_streamed_components(request):
+                    yield chunk
+            finally:
+                translation.deactivate()
+                # The request's connections were already closed (by the
+                # request_finished signal) before the response was iterated,
+                # so close the ones the streamed components reopened.
+                for connection in connections.all():
+                    connection.close()
+            if page_end:
+                yield page_end
+
+        return StreamingHttpResponse(content())
+
     def _get_guard_fail_response(self, request, kwargs, guard_fail):
         if request.is_ajax():
             return self._add_response_headers(json_response(
@@ -1213,14 +2498,172 @@ class ComponentView(FrameworkBaseMixin, View):
         if not hasattr(self, "component") or not self.component:
             return response
         all_components = self.component.dependent_components + [self.component]
-        for component in all_components:
-            for key, value in component.extra_response_headers.items():
-                if isinstance(key, unicode):
-                    key = key.encode("utf-8")
-                if isinstance(value, unicode):
-                    value = value.encode("utf-8")
-                response[key] = value
-        return response
+        return add_components_response_headers(response, all_components)
+
+class BatchComponentView(ComponentView):
+    """
+    Loads several deferred components in one request, instead of one
+    request per `cmp-deferred` placeholder.
+
+    GET parameters:
+        page_key: the page_key of the page the components are on
+        components: a JSON list of objects with the `component_key`, and
+            optionally the `param_key` and `kwargs`, of each component
+
+    The components share one ObjectCache, and are all guarded before any of
+    them is initialized further. The response is the same `actions` JSON as
+    ComponentView's partial page responses (or its guard failure response,
+    for the "worst" guard failure), plus `order`, the action keys by
+    `defer_priority`, highest first.
+
+    Components are loaded passively (like dependent components), so they
+    can't guard or add dependent components.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    def __init__(self, **initkwargs):
+        View.__init__(self, **initkwargs)
+        self.component = None
+        self.components = []
+
+    def _parse_component_specs(self, request):
+        """
+        Returns a list of (ComponentClass, kwargs, param_key) tuples, or None
+        if the request is malformed.
+        """
+        try:
+            specs = json.loads(request.GET.get('components', ''))
+        except ValueError:
+            return None
+        if (not isinstance(specs, list)
+                or len(specs) > getattr(settings, 'COMPONENT_BATCH_MAX_SIZE', 50)):
+            return None
+
+        parsed = []
+        seen = set()
+        for spec in specs:
+            if not isinstance(spec, dict):
+                return None
+            component_key = spec.get('component_key')
+            ComponentClass = COMPONENT_KEYS['to_component_class'].get(component_key)
+            kwargs = spec.get('kwargs') or {}
+            param_key = spec.get('param_key') or None
+            if ComponentClass is None or not isinstance(kwargs, dict):
+                return None
+            try:
+                kwargs = dict((str(key), unicode(value)) for key, value in kwargs.items())
+            except UnicodeEncodeError:
+                return None
+
+            # Only accept exactly the kwargs of the component's own url, as
+            # they end up in its kwargs, param_key and cache keys.
+            try:
+                if param_key is not None:
+                    if param_key != self.get_param_key(component_key, kwargs):
+                        return None
+                else:
+                    reverse(component_key, kwargs=kwargs)
+            except NoReverseMatch:
+                return None
+
+            if (component_key, param_key) not in seen:
+                seen.add((component_key, param_key))
+                parsed.append((ComponentClass, kwargs, param_key))
+        return parsed
+
+    def get(self, request):
+        specs = self._parse_component_specs(request)
+        page_key = request.GET.get('page_key')
+        if specs is None or page_key not in PAGE_KEYS['to_page_class']:
+            return HttpResponseBadRequest()
+
+        # The components are rendered like their deferred requests would be
+        request.GET = request.GET.copy()
+        request.GET['deferred'] = 'true'
+
+        self.obj_cache = ObjectCache(init=self.init_obj_cache)
+        self.obj_cache.profiler = self.profiler
+        self.guard_fail = None
+        for ComponentClass, kwargs, param_key in specs:
+            request_info = StrippedRequestInfo(request, page_key, kwargs, passive=True)
+            component = ComponentClass(request_info, self.obj_cache, param_key=param_key,
+                                       guard_only=True)
+            self.check_guard(component)
+            self.components.append(component)
+
+        if self.guard_fail:
+            return self._get_guard_fail_response(request, {}, self.guard_fail)
+
+        # Highest defer_priority first, otherwise in the requested order
+        self.components.sort(key=lambda component: -component.defer_priority)
+        for component in self.components:
+            component.promote()
+            component.run_final()
+            component.init_child_components(component.request_info)
+
+        actions = [component.get_response_action_tuple(request) for component in self.components]
+        return self._add_response_headers(json_response({
+            'actions': dict(actions),
+            'order': [action_key for action_key, action in actions],
+        }))
+
+    def _add_response_headers(self, response):
+        return add_components_response_headers(response, self.components)
+
+def add_components_response_headers(response, components):
+    """
+    Add the custom headers of `components` to the response object
+    """
+    for component in components:
+        for key, value in component.extra_response_headers.items():
+            if isinstance(key, unicode):
+                key = key.encode("utf-8")
+            if isinstance(value, unicode):
+                value = value.encode("utf-8")
+            response[key] = value
+    return response
+
+def get_prefetch_request(request):
+    """
+    A copy of `request` that looks like the deferred request for a
+    component on its page.
+    """
+    prefetch_request = copy.copy(request)
+    prefetch_request.__dict__.pop('_request', None)
+    prefetch_request.method = 'GET'
+    prefetch_request.GET = request.GET.copy()
+    prefetch_request.GET['deferred'] = 'true'
+    prefetch_request.META = dict(request.META, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+    return prefetch_request
+
+def prefetch_deferred_components(request, specs, nonce):
+    """
+    Initializes and renders deferred components, given as (ComponentClass,
+    kwargs, param_key, page_key) tuples, the way their deferred requests
+    would, and caches the renders for those requests (which carry `nonce`,
+    see ObjectCache.get_prefetch_nonce). Run in the background after
+    `request`'s response has been sent.
+    """
+    prefetch_request = get_prefetch_request(request)
+    prefetch_request.GET[PREFETCH_PARAM] = nonce
+    obj_cache = ObjectCache()
+    timeout = getattr(settings, 'COMPONENT_PREFETCH_TIMEOUT', 30)
+    for ComponentClass, kwargs, param_key, page_key in specs:
+        try:
+            request_info = StrippedRequestInfo(prefetch_request, page_key, kwargs, passive=True)
+            component = ComponentClass(request_info, obj_cache, param_key=param_key)
+            cache_key = component.get_prefetch_cache_key()
+            if component.guard_fail or cache_key is None:
+                continue
+            component.run_final()
+            component.init_child_components(request_info)
+            if component.cached_render is not None:
+                render_output = component.cached_render
+            else:
+                render_output = component._render(prefetch_request)
+            get_component_cache().set(cache_key, render_output, timeout)
+        except Exception:
+            logger.exception("Failed prefetching component %s", ComponentClass.__name__)
 
 def execute_request(request,
                     url_name,
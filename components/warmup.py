@@ -0,0 +1,83 @@
+import logging
+
+from django.conf import settings
+from django.core.urlresolvers import get_resolver
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+# Templates rendered by the framework itself
+FRAMEWORK_TEMPLATES = (
+    'includes/defer_loading.html',
+    'includes/stream_placeholder.html',
+    'includes/stream_chunk.html',
+)
+
+def get_component_template_names():
+    """
+    The template_name of every registered Component and Page, followed by
+    the framework's own templates. Loads the root urlconf so that all the
+    component_urls are registered.
+    """
+    from .views import COMPONENT_KEYS, PAGE_KEYS
+
+    get_resolver(None).url_patterns
+
+    classes = (COMPONENT_KEYS['to_component_class'].values()
+               + PAGE_KEYS['to_page_class'].values())
+    template_names = sorted(set(cls.template_name for cls in classes if cls.template_name))
+    return template_names + [name for name in FRAMEWORK_TEMPLATES if name not in template_names]
+
+def uses_cached_loader():
+    for loader in settings.TEMPLATE_LOADERS:
+        if isinstance(loader, (tuple, list)):
+            loader = loader[0]
+        if loader == 'django.template.loaders.cached.Loader':
+            return True
+    return False
+
+def load_templates(template_names=None):
+    """
+    Loads and compiles every template in `template_names` (by default the
+    ones of `get_component_template_names`). With the cached template
+    loader configured, the compiled templates are kept for the rest of the
+    process' life. Returns the names of the templates that loaded, and a
+    dict of the ones that didn't mapped to the error.
+    """
+    if template_names is None:
+        template_names = get_component_template_names()
+
+    loaded = []
+    errors = {}
+    for template_name in template_names:
+        try:
+            get_template(template_name)
+        except TemplateDoesNotExist, e:
+            errors[template_name] = "Template does not exist: %s" % e
+        except TemplateSyntaxError, e:
+            errors[template_name] = "Template syntax error: %s" % e
+        else:
+            loaded.append(template_name)
+    return loaded, errors
+
+def warm_templates():
+    """
+    Compiles the templates of all registered Components and Pages into the
+    cached template loader of this process, logging the ones that failed
+    to load.
+
+    Call this from wsgi.py (or other startup code of the server process),
+    after creating the application, so the compiling happens before the
+    process serves requests. With pre-forking servers, load the application
+    before forking (eg. gunicorn's --preload) so all the workers share the
+    compiled templates rather than each compiling their own.
+    """
+    loaded, errors = load_templates()
+    if not uses_cached_loader():
+        logger.warning("Component templates were loaded, but they won't be kept without "
+                       "'django.template.loaders.cached.Loader' in TEMPLATE_LOADERS")
+    for template_name, error in sorted(errors.items()):
+        logger.error("Couldn't load component template %s: %s", template_name, error)
+    logger.info("Warmed up %d component templates", len(loaded))
+    return loaded, errors